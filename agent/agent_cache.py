@@ -0,0 +1,97 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Generic, Optional, TypeVar
+
+from metrics.registry import registry
+
+T = TypeVar("T")
+
+
+class AgentCache(Generic[T]):
+    """
+    Keeps at most max_agents agents resident, the least recently used one is evicted first
+    and agents idle for more than idle_ttl seconds are dropped.
+    Evicted agents are rebuilt by the factory on the next message of their user.
+    """
+    _max_agents: int = 50
+    _idle_ttl: int = 3600  # seconds
+
+    def __init__(self, factory: Callable[[str], T],
+                 max_agents: Optional[int] = None,
+                 idle_ttl: Optional[int] = None):
+        self.factory = factory
+        self.max_agents = max_agents if max_agents is not None else self._max_agents
+        self.idle_ttl = idle_ttl if idle_ttl is not None else self._idle_ttl
+        self.agents: OrderedDict[str, T] = OrderedDict()
+        self.last_access: Dict[str, float] = dict()
+        self.building: Dict[str, threading.Lock] = dict()
+        self.lock = threading.Lock()
+        self.created = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, user_id: str) -> T:
+        agent = self._lookup(user_id)
+        if agent is not None:
+            return agent
+        with self.lock:
+            building = self.building.setdefault(user_id, threading.Lock())
+        # only the same user waits while its agent is built
+        with building:
+            agent = self._lookup(user_id)
+            if agent is None:
+                agent = self.factory(user_id)
+                with self.lock:
+                    self.agents[user_id] = agent
+                    self.last_access[user_id] = time.monotonic()
+                    self.created += 1
+                    self._evict()
+        with self.lock:
+            self.building.pop(user_id, None)
+        return agent
+
+    def remove(self, user_id: str):
+        with self.lock:
+            self.agents.pop(user_id, None)
+            self.last_access.pop(user_id, None)
+
+    def get_stats(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(
+                resident=len(self.agents),
+                created=self.created,
+                evictions=self.evictions,
+                expirations=self.expirations,
+            )
+
+    def _lookup(self, user_id: str) -> Optional[T]:
+        with self.lock:
+            self._expire()
+            if user_id not in self.agents:
+                return None
+            self.agents.move_to_end(user_id)
+            self.last_access[user_id] = time.monotonic()
+            return self.agents[user_id]
+
+    def _expire(self):
+        if self.idle_ttl <= 0:
+            return
+        now = time.monotonic()
+        # agents are ordered by last access, stop at the first one still alive
+        for user_id in list(self.agents.keys()):
+            if now - self.last_access[user_id] < self.idle_ttl:
+                break
+            del self.agents[user_id]
+            del self.last_access[user_id]
+            self.expirations += 1
+            registry.inc("agents_expired_total")
+            print("Agent of {} expired after {} seconds of inactivity".format(user_id, self.idle_ttl))
+
+    def _evict(self):
+        while len(self.agents) > self.max_agents:
+            user_id, _ = self.agents.popitem(last=False)
+            del self.last_access[user_id]
+            self.evictions += 1
+            registry.inc("agents_evicted_total")
+            print("Agent of {} evicted, {} agents resident".format(user_id, len(self.agents)))
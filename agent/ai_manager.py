@@ -1,26 +1,55 @@
-from typing import List, Dict
+from typing import List, Dict, Callable, Optional, Any
 from langchain.schema import Document
+from agent.agent_cache import AgentCache
 from graph.agent import AgentWrapper
+from metrics.registry import registry
+import blocking
+import resources
+from tools.tool_cache import tool_result_cache
 
 
 class AIManager:
 
-    def __init__(self, openai_api_key: str):
+    def __init__(self, openai_api_key: str, max_agents: Optional[int] = None, agent_idle_ttl: Optional[int] = None,
+                 context_budget: Optional[int] = None, memory_mode: Optional[str] = None,
+                 docstore_backend: Optional[str] = None, tool_min_score: Optional[float] = None,
+                 tool_score_margin: Optional[float] = None):
         self.openai_api_key = openai_api_key
-        self.agents: Dict[str, AgentWrapper] = dict()
+        self.context_budget = context_budget
+        self.memory_mode = memory_mode
+        self.docstore_backend = docstore_backend
+        self.tool_min_score = tool_min_score
+        self.tool_score_margin = tool_score_margin
+        self.agents: AgentCache[AgentWrapper] = AgentCache(self._create_agent,
+                                                           max_agents=max_agents,
+                                                           idle_ttl=agent_idle_ttl)
+        registry.gauge("agents_resident", lambda: len(self.agents.agents))
+        registry.gauge("tool_cache_entries", lambda: len(tool_result_cache.entries))
+
+    def _create_agent(self, user_id: str) -> AgentWrapper:
+        return AgentWrapper(self.openai_api_key, user_id, self.context_budget, self.memory_mode,
+                            self.docstore_backend, self.tool_min_score, self.tool_score_margin)
 
     def get_agent(self, user_id: str):
-        if user_id not in self.agents:
-            self.agents[user_id] = AgentWrapper(self.openai_api_key, user_id)
-        return self.agents[user_id]
+        return self.agents.get(user_id)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(agents=self.agents.get_stats(),
+                    tool_cache=tool_result_cache.get_stats(),
+                    embedding_cache=resources.get_embedding_cache_stats())
 
     def process_document(self, user_id: str, docs: List[Document], msg_id: int):
         agent = self.get_agent(user_id)
         agent.add_document(docs, msg_id)
 
-    def ask(self, user_id: str, query: str):
+    def ask(self, user_id: str, query: str, on_update: Optional[Callable[[str], None]] = None):
         agent = self.get_agent(user_id)
-        return agent.run(query)
+        return agent.run(query, on_update)
+
+    async def aask(self, user_id: str, query: str, on_update: Optional[Callable[[str], None]] = None):
+        # building an agent opens the stores, keep it off the event loop
+        agent = await blocking.run_blocking(self.get_agent, user_id)
+        return await agent.arun(query, on_update)
 
     def get_features(self, user_id: str):
         agent = self.get_agent(user_id)
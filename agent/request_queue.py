@@ -0,0 +1,87 @@
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+
+class UserQueueFullError(Exception):
+    def __init__(self, user_id: str, depth: int):
+        super().__init__("user {} has already {} pending requests".format(user_id, depth))
+        self.user_id = user_id
+        self.depth = depth
+
+
+@dataclass
+class QueuedRequest:
+    message: str
+    payload: Any
+    future: asyncio.Future
+    arrived: float = field(default_factory=time.monotonic)
+
+
+class UserRequestQueue:
+    """
+    Serializes the agent turns of each user while different users keep running in parallel.
+    Messages queued while a turn is running are merged into a single turn: the last request of the batch
+    gets the result, the others are resolved with None. A message on an idle queue starts right away,
+    a batch waits for the coalesce window only while more messages keep arriving.
+    """
+    _max_depth: int = 3
+    _coalesce_window: float = 0.3  # seconds
+
+    def __init__(self, process: Callable[[str, str, Any], Awaitable[Any]],
+                 max_depth: Optional[int] = None,
+                 coalesce_window: Optional[float] = None):
+        self.process = process
+        self.max_depth = max_depth if max_depth is not None else self._max_depth
+        self.coalesce_window = coalesce_window if coalesce_window is not None else self._coalesce_window
+        self.pending: Dict[str, Deque[QueuedRequest]] = dict()
+        self.workers: Dict[str, asyncio.Task] = dict()
+
+    async def submit(self, user_id: str, message: str, payload: Any = None) -> Any:
+        pending = self.pending.setdefault(user_id, deque())
+        if len(pending) >= self.max_depth:
+            raise UserQueueFullError(user_id, len(pending))
+        request = QueuedRequest(message=message, payload=payload,
+                                future=asyncio.get_running_loop().create_future())
+        pending.append(request)
+        if user_id not in self.workers:
+            self.workers[user_id] = asyncio.create_task(self._drain(user_id))
+        return await request.future
+
+    def get_depth(self, user_id: str) -> int:
+        return len(self.pending.get(user_id, ()))
+
+    async def _drain(self, user_id: str):
+        pending = self.pending[user_id]
+        try:
+            while pending:
+                await self._wait_burst(pending)
+                batch = list(pending)
+                pending.clear()
+                message = "\n".join(request.message for request in batch)
+                try:
+                    result = await self.process(user_id, message, batch[-1].payload)
+                except Exception as e:
+                    for request in batch:
+                        if not request.future.done():
+                            request.future.set_exception(e)
+                    continue
+                for request in batch[:-1]:
+                    if not request.future.done():
+                        request.future.set_result(None)
+                if not batch[-1].future.done():
+                    batch[-1].future.set_result(result)
+        finally:
+            del self.workers[user_id]
+            if not pending:
+                del self.pending[user_id]
+
+    async def _wait_burst(self, pending: Deque[QueuedRequest]):
+        # a single message never waits, a batch waits only while its last message is more recent than the window
+        while len(pending) > 1:
+            quiet = time.monotonic() - pending[-1].arrived
+            if quiet >= self.coalesce_window:
+                return
+            await asyncio.sleep(self.coalesce_window - quiet)
@@ -0,0 +1,46 @@
+from typing import Any, Dict, List, Tuple
+
+from benchmark.fake_server import FakeJsonServer
+
+ROOMS = ["kitchen", "living room", "bedroom", "office", "bathroom"]
+
+
+def fake_entities() -> List[Dict[str, Any]]:
+    entities = []
+    for room in ROOMS:
+        slug = room.replace(" ", "_")
+        entities.append(dict(entity_id="light.{}".format(slug), state="off",
+                             attributes=dict(friendly_name="{} light".format(room).capitalize())))
+        entities.append(dict(entity_id="switch.{}_plug".format(slug), state="on",
+                             attributes=dict(friendly_name="{} plug".format(room).capitalize())))
+    entities.append(dict(entity_id="person.bench", state="home", attributes=dict(friendly_name="Bench")))
+    return entities
+
+
+class FakeHomeAssistantServer(FakeJsonServer):
+    """ Home Assistant REST API: states, services, service calls and the conversation agent """
+    name = "fake-home-assistant"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.entities = fake_entities()
+
+    def handle(self, method: str, path: str, body: Dict[str, Any]) -> Tuple[int, Any]:
+        path = path.split("?")[0]
+        self.count(path)
+        if path == "/api/states":
+            return 200, self.entities
+        if path == "/api/services" and method == "GET":
+            return 200, [dict(domain="light", services=dict(turn_on={}, turn_off={}, toggle={})),
+                         dict(domain="switch", services=dict(turn_on={}, turn_off={}, toggle={}))]
+        if path.startswith("/api/services/") and method == "POST":
+            _, _, _, domain, service = path.split("/")
+            for entity in self.entities:
+                if entity["entity_id"] == body.get("entity_id") and service in ("turn_on", "turn_off"):
+                    entity["state"] = "on" if service == "turn_on" else "off"
+            return 200, []
+        if path == "/api/conversation/process":
+            speech = "Done: {}".format(body.get("text", ""))
+            return 200, dict(response=dict(response_type="action_done", speech=dict(plain=dict(speech=speech))),
+                             conversation_id=body.get("conversation_id"))
+        return 404, dict(message="not found")
@@ -0,0 +1,199 @@
+import hashlib
+import json
+import math
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+EMBEDDING_SIZE = 64
+
+
+def fake_embedding(value: Any) -> List[float]:
+    """ deterministic unit vector derived from the text (or the token ids sent by OpenAIEmbeddings) """
+    digest = hashlib.sha256(json.dumps(value).encode("utf-8")).digest()
+    vector = [(digest[i % len(digest)] * (i + 1) % 255) / 255 - 0.5 for i in range(EMBEDDING_SIZE)]
+    norm = math.sqrt(sum(v * v for v in vector)) or 1
+    return [v / norm for v in vector]
+
+
+class FakeOpenAIPolicy:
+    """
+    Decides the deterministic answer of a chat completion:
+    - forced functions (e.g. index_chunk) get their arguments generated
+    - once a tool result is available the Response tool is called
+    - otherwise the first matching tool is called with the user text
+    - requests without tools (multi query expansion, summaries) get plain text
+    """
+    # keyword in the user text -> tool to call
+    ROUTES = [
+        ("light", "home_assistant_agent"),
+        ("movie", "movies-retriever"),
+        ("search", "duckduckgo_search"),
+    ]
+    DEFAULT_TOOL = "document-extractor"
+
+    def answer(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        messages = body.get("messages", [])
+        tool_names = [t["function"]["name"] for t in body.get("tools", [])]
+        user_text = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+        if isinstance(user_text, list):
+            user_text = " ".join(part.get("text", "") for part in user_text)
+        function_call = body.get("function_call")
+        if isinstance(function_call, dict) and function_call.get("name") == "index_chunk":
+            questions = ["What is described in section {}?".format(i) for i in range(3)]
+            summary = "Summary of: {}".format(user_text[:200])
+            return dict(function_call=dict(name="index_chunk",
+                                           arguments=json.dumps(dict(summary=summary, questions=questions))))
+        tool_choice = body.get("tool_choice")
+        if isinstance(tool_choice, dict):
+            name = tool_choice["function"]["name"]
+            return dict(tool_calls=[self._tool_call(name, self._forced_arguments(name, user_text))])
+        if not tool_names:
+            return dict(content="{}\n{} (alternative)".format(user_text[:200], user_text[:200]))
+        if messages and messages[-1].get("role") == "tool":
+            output = "Fake answer to: {}".format(user_text[:200])
+            return dict(tool_calls=[self._tool_call("Response", dict(output=output, message_id="0"))])
+        for keyword, tool in self.ROUTES:
+            if keyword in user_text.lower() and tool in tool_names:
+                return dict(tool_calls=[self._tool_call(tool, self._tool_arguments(tool, user_text))])
+        if self.DEFAULT_TOOL in tool_names:
+            return dict(tool_calls=[self._tool_call(self.DEFAULT_TOOL, dict(query=user_text))])
+        output = "Fake answer to: {}".format(user_text[:200])
+        return dict(tool_calls=[self._tool_call("Response", dict(output=output, message_id="0"))])
+
+    @staticmethod
+    def _tool_arguments(tool: str, user_text: str) -> Dict[str, Any]:
+        if tool == "home_assistant_agent":
+            return dict(sentence=user_text)
+        return dict(query=user_text)
+
+    @staticmethod
+    def _forced_arguments(name: str, user_text: str) -> Dict[str, Any]:
+        return dict(output=user_text[:200])
+
+    @staticmethod
+    def _tool_call(name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        return dict(id="call_{}".format(uuid.uuid4().hex[:12]), type="function",
+                    function=dict(name=name, arguments=json.dumps(arguments)))
+
+
+class FakeOpenAIServer:
+    """ OpenAI compatible endpoints (/v1/chat/completions, /v1/embeddings) with configurable latency """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.2,
+                 token_latency: float = 0.0, policy: Optional[FakeOpenAIPolicy] = None):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.policy = policy or FakeOpenAIPolicy()
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                server.requests += 1
+                time.sleep(server.latency)
+                if self.path.endswith("/embeddings"):
+                    self._send_json(server.embeddings(body))
+                elif self.path.endswith("/chat/completions"):
+                    if body.get("stream"):
+                        self._send_stream(server.chat_chunks(body))
+                    else:
+                        self._send_json(server.chat(body))
+                else:
+                    self.send_error(404)
+
+            def _send_json(self, payload):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_stream(self, chunks):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for chunk in chunks:
+                    self._write_chunk("data: {}\n\n".format(json.dumps(chunk)).encode("utf-8"))
+                    if server.token_latency:
+                        time.sleep(server.token_latency)
+                self._write_chunk(b"data: [DONE]\n\n")
+                self._write_chunk(b"")
+
+            def _write_chunk(self, data: bytes):
+                self.wfile.write("{:x}\r\n".format(len(data)).encode("ascii") + data + b"\r\n")
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="fake-openai", daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return "http://{}:{}/v1".format(host, port)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    @staticmethod
+    def embeddings(body: Dict[str, Any]) -> Dict[str, Any]:
+        inputs = body["input"]
+        if not isinstance(inputs, list) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        data = [dict(object="embedding", index=i, embedding=fake_embedding(value)) for i, value in enumerate(inputs)]
+        return dict(object="list", data=data, model=body.get("model"),
+                    usage=dict(prompt_tokens=len(inputs), total_tokens=len(inputs)))
+
+    def chat(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        message = dict(role="assistant", content=None)
+        message.update(self.policy.answer(body))
+        finish_reason = "tool_calls" if "tool_calls" in message else \
+            "function_call" if "function_call" in message else "stop"
+        prompt_tokens = len(json.dumps(body.get("messages", []))) // 4
+        completion_tokens = len(json.dumps(message)) // 4
+        return dict(id="chatcmpl-{}".format(uuid.uuid4().hex), object="chat.completion", created=int(time.time()),
+                    model=body.get("model"),
+                    choices=[dict(index=0, message=message, finish_reason=finish_reason)],
+                    usage=dict(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                               total_tokens=prompt_tokens + completion_tokens))
+
+    def chat_chunks(self, body: Dict[str, Any]):
+        answer = self.policy.answer(body)
+        base = dict(id="chatcmpl-{}".format(uuid.uuid4().hex), object="chat.completion.chunk",
+                    created=int(time.time()), model=body.get("model"))
+        yield dict(base, choices=[dict(index=0, delta=dict(role="assistant", content=""), finish_reason=None)])
+        if answer.get("content"):
+            for word in answer["content"].split(" "):
+                yield dict(base, choices=[dict(index=0, delta=dict(content=word + " "), finish_reason=None)])
+            finish_reason = "stop"
+        elif answer.get("function_call"):
+            yield dict(base, choices=[dict(index=0, delta=dict(function_call=answer["function_call"]),
+                                           finish_reason=None)])
+            finish_reason = "function_call"
+        else:
+            for index, tool_call in enumerate(answer["tool_calls"]):
+                arguments = tool_call["function"]["arguments"]
+                head = dict(index=index, id=tool_call["id"], type="function",
+                            function=dict(name=tool_call["function"]["name"], arguments=""))
+                yield dict(base, choices=[dict(index=0, delta=dict(tool_calls=[head]), finish_reason=None)])
+                for i in range(0, len(arguments), 8):
+                    piece = dict(index=index, function=dict(arguments=arguments[i:i + 8]))
+                    yield dict(base, choices=[dict(index=0, delta=dict(tool_calls=[piece]), finish_reason=None)])
+            finish_reason = "tool_calls"
+        yield dict(base, choices=[dict(index=0, delta=dict(), finish_reason=finish_reason)])
@@ -0,0 +1,74 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+
+
+class FakeJsonServer:
+    """ threaded local HTTP server answering JSON requests through handle(method, path, body) """
+    name: str = "fake-server"
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0):
+        self.latency = latency
+        self.requests: Dict[str, int] = dict()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                self._dispatch("GET")
+
+            def do_POST(self):
+                self._dispatch("POST")
+
+            def _dispatch(self, method: str):
+                length = int(self.headers.get("Content-Length", 0))
+                raw = self.rfile.read(length) if length else b""
+                body = server.parse_body(raw, self.headers.get("Content-Type", ""))
+                if server.latency:
+                    time.sleep(server.latency)
+                status, payload = server.handle(method, self.path, body)
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name=self.name, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def count(self, key: str):
+        self.requests[key] = self.requests.get(key, 0) + 1
+
+    @staticmethod
+    def parse_body(raw: bytes, content_type: str) -> Optional[Dict[str, Any]]:
+        if not raw:
+            return dict()
+        if "json" in content_type:
+            return json.loads(raw)
+        # the Bot API is called with form encoded parameters
+        from urllib.parse import parse_qs
+        return {k: v[0] for k, v in parse_qs(raw.decode("utf-8")).items()}
+
+    def handle(self, method: str, path: str, body: Dict[str, Any]) -> Tuple[int, Any]:
+        raise NotImplementedError()
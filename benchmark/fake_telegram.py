@@ -0,0 +1,34 @@
+import itertools
+import time
+from typing import Any, Dict, Tuple
+
+from benchmark.fake_server import FakeJsonServer
+
+
+class FakeTelegramServer(FakeJsonServer):
+    """ minimal Bot API: every call succeeds, sent messages get increasing ids """
+    name = "fake-telegram"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.message_ids = itertools.count(1000)
+
+    @property
+    def bot_base_url(self) -> str:
+        return "{}/bot".format(self.base_url)
+
+    def handle(self, method: str, path: str, body: Dict[str, Any]) -> Tuple[int, Any]:
+        api_method = path.rstrip("/").split("/")[-1]
+        self.count(api_method)
+        if api_method == "getMe":
+            result = dict(id=1, is_bot=True, first_name="bench", username="bench_bot",
+                          can_join_groups=False, can_read_all_group_messages=False, supports_inline_queries=False)
+        elif api_method in ("sendMessage", "editMessageText"):
+            chat_id = int(body.get("chat_id", 1))
+            message_id = int(body["message_id"]) if "message_id" in body else next(self.message_ids)
+            result = dict(message_id=message_id, date=int(time.time()), text=body.get("text", ""),
+                          chat=dict(id=chat_id, type="private"))
+        else:
+            # sendChatAction, deleteMessage, ...
+            result = True
+        return 200, dict(ok=True, result=result)
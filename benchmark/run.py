@@ -0,0 +1,238 @@
+"""
+Offline benchmark of the bot: OpenAI, Telegram and Home Assistant are replaced by local fake servers.
+
+    python -m benchmark.run --scenario agent --users 20 --turns 5 --latency 0.2
+"""
+import argparse
+import asyncio
+import math
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, List
+
+from benchmark.fake_home_assistant import FakeHomeAssistantServer
+from benchmark.fake_openai import FakeOpenAIServer
+from benchmark.fake_telegram import FakeTelegramServer
+
+API_KEY = "sk-benchmark"
+BOT_TOKEN = "1:benchmark"
+QUERIES = [
+    "what is written in my contract?",
+    "turn on the kitchen light",
+    "search the weather forecast for tomorrow",
+    "when does my insurance expire?",
+]
+
+
+def get_user_id(index: int) -> str:
+    return "bench_user_{}".format(index)
+
+
+def get_query(user: int, turn: int) -> str:
+    return "{} ({}-{})".format(QUERIES[(user + turn) % len(QUERIES)], user, turn)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    values = sorted(values)
+    if not values:
+        return 0.0
+    # nearest rank
+    index = min(len(values) - 1, max(0, math.ceil(pct / 100 * len(values)) - 1))
+    return values[index]
+
+
+def peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes on linux
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def report(name: str, latencies: List[float], errors: int, elapsed: float):
+    print("")
+    print("scenario:     {}".format(name))
+    print("turns:        {} ({} errors)".format(len(latencies), errors))
+    if latencies:
+        print("latency p50:  {:.3f}s".format(percentile(latencies, 50)))
+        print("latency p95:  {:.3f}s".format(percentile(latencies, 95)))
+        print("latency p99:  {:.3f}s".format(percentile(latencies, 99)))
+        print("latency mean: {:.3f}s".format(statistics.mean(latencies)))
+    print("turns/sec:    {:.2f}".format(len(latencies) / elapsed if elapsed else 0))
+    print("elapsed:      {:.2f}s".format(elapsed))
+    print("peak RSS:     {:.1f} MB".format(peak_rss_mb()))
+
+
+def setup_users(users: int, ha_url: str):
+    from settings.user_settings import UserSettings
+    for i in range(users):
+        settings = UserSettings(get_user_id(i))
+        settings.set_tool_parameter("url", ha_url)
+        settings.set_tool_parameter("bearer_token", "benchmark")
+        settings.set_tool_enabled("home_assistant_ai", True)
+
+
+def run_threaded(users: int, turns: int, turn: Callable[[int, int], None]):
+    """ every user sends its turns in sequence, users run concurrently """
+
+    def user_session(user: int):
+        latencies, errors = [], 0
+        for t in range(turns):
+            start = time.perf_counter()
+            try:
+                turn(user, t)
+                latencies.append(time.perf_counter() - start)
+            except Exception as e:
+                errors += 1
+                print("Turn {}-{} failed: {}".format(user, t, e))
+        return latencies, errors
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        sessions = list(pool.map(user_session, range(users)))
+    return [v for latencies, _ in sessions for v in latencies], sum(e for _, e in sessions), \
+        time.perf_counter() - start
+
+
+def agent_scenario(args, servers):
+    from agent.ai_manager import AIManager
+    ai_manager = AIManager(API_KEY, max_agents=args.users)
+
+    def turn(user: int, t: int):
+        ai_manager.ask(get_user_id(user), get_query(user, t))
+
+    return run_threaded(args.users, args.turns, turn)
+
+
+def ingest_scenario(args, servers):
+    from langchain.schema import Document
+    from vectorstore.vector_store_wrapper import VectorStoreWrapper
+    stores = [VectorStoreWrapper(API_KEY, get_user_id(i)) for i in range(args.users)]
+
+    def turn(user: int, t: int):
+        pages = [Document(page_content="Page {} of document {}. ".format(p, t) * 80,
+                          metadata=dict(page_index=p, source="doc-{}.pdf".format(t)))
+                 for p in range(args.pages)]
+        stores[user].add_document(pages, 1000 + t)
+
+    return run_threaded(args.users, args.turns, turn)
+
+
+def handlers_scenario(args, servers):
+    from telegram import Update
+    from telegram.ext import CallbackContext
+    from tel_doc_bot import TelDocBot
+
+    bot = TelDocBot(dict(
+        openai_api_key=API_KEY,
+        telegram_bot_token=BOT_TOKEN,
+        telegram_base_url=servers["telegram"].bot_base_url,
+        region_name="eu-west-1",
+        aws_access_key_id="benchmark",
+        aws_secret_access_key="benchmark",
+        bucket_name="benchmark",
+        max_workers=args.workers,
+        max_agents=args.users,
+        coalesce_window=args.coalesce_window,
+        native_async=args.native_async,
+    ))
+    application = bot.application
+    latencies, errors = [], 0
+
+    async def user_session(user: int):
+        nonlocal errors
+        for t in range(args.turns):
+            update = Update.de_json({
+                "update_id": user * args.turns + t,
+                "message": {
+                    "message_id": t + 1,
+                    "date": int(datetime.now().timestamp()),
+                    "chat": {"id": user + 1, "type": "private"},
+                    "from": {"id": user + 1, "is_bot": False, "first_name": "bench",
+                             "username": get_user_id(user), "language_code": "en"},
+                    "text": get_query(user, t),
+                },
+            }, application.bot)
+            context = CallbackContext.from_update(update, application)
+            start = time.perf_counter()
+            try:
+                await bot.questions(update, context)
+                latencies.append(time.perf_counter() - start)
+            except Exception as e:
+                errors += 1
+                print("Turn {}-{} failed: {}".format(user, t, e))
+
+    async def main():
+        await application.initialize()
+        try:
+            start = time.perf_counter()
+            await asyncio.gather(*(user_session(i) for i in range(args.users)))
+            return time.perf_counter() - start
+        finally:
+            await application.shutdown()
+
+    elapsed = asyncio.run(main())
+    bot.executor.shutdown()
+    return latencies, errors, elapsed
+
+
+SCENARIOS = dict(
+    agent=agent_scenario,
+    handlers=handlers_scenario,
+    ingest=ingest_scenario,
+)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the telegram AI bot")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="agent")
+    parser.add_argument("--users", type=int, default=10, help="simulated users, each one sends its turns in sequence")
+    parser.add_argument("--turns", type=int, default=5, help="turns (or documents for ingest) per user")
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds added to every OpenAI request")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="seconds between streamed chunks")
+    parser.add_argument("--ha-latency", type=float, default=0.05, help="seconds added to every HA request")
+    parser.add_argument("--pages", type=int, default=3, help="pages per document in the ingest scenario")
+    parser.add_argument("--workers", type=int, default=16, help="max_workers of the handlers scenario")
+    parser.add_argument("--coalesce-window", type=float, default=0.0)
+    parser.add_argument("--native-async", action="store_true")
+    parser.add_argument("--keep-data", action="store_true", help="don't delete the temporary working directory")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    servers = dict(
+        openai=FakeOpenAIServer(latency=args.latency, token_latency=args.token_latency).start(),
+        telegram=FakeTelegramServer().start(),
+        home_assistant=FakeHomeAssistantServer(latency=args.ha_latency).start(),
+    )
+    # read by the openai client when ChatOpenAI and OpenAIEmbeddings are built
+    os.environ["OPENAI_API_BASE"] = servers["openai"].base_url
+    os.environ["OPENAI_BASE_URL"] = servers["openai"].base_url
+    os.environ["OPENAI_API_KEY"] = API_KEY
+    # the databases are created relative to the working directory
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    work_dir = tempfile.mkdtemp(prefix="tel-doc-bot-bench-")
+    os.chdir(work_dir)
+    os.makedirs("production_database", exist_ok=True)
+    print("Working directory: {}".format(work_dir))
+    try:
+        setup_users(args.users, servers["home_assistant"].base_url)
+        latencies, errors, elapsed = SCENARIOS[args.scenario](args, servers)
+        report(args.scenario, latencies, errors, elapsed)
+        print("OpenAI requests: {}".format(servers["openai"].requests))
+    finally:
+        for server in servers.values():
+            server.stop()
+        if not args.keep_data:
+            import shutil
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+import asyncio
+import functools
+from concurrent.futures import Executor
+from typing import Any, Callable, Optional
+
+# pool of the blocking calls made from the event loop (agent builds, stores and cache lookups),
+# the bot sets its bounded worker pool, the loop default executor is used until then
+_executor: Optional[Executor] = None
+
+
+def set_executor(executor: Optional[Executor]):
+    global _executor
+    _executor = executor
+
+
+def get_executor() -> Optional[Executor]:
+    return _executor
+
+
+async def run_blocking(func: Callable[..., Any], *args, **kwargs) -> Any:
+    return await asyncio.get_running_loop().run_in_executor(_executor, functools.partial(func, *args, **kwargs))
@@ -0,0 +1,61 @@
+import asyncio
+from typing import Optional
+
+from telegram import Message
+from telegram.constants import MessageLimit
+from telegram.error import RetryAfter, TelegramError
+
+
+class ReplyStreamer:
+    """
+    Progressively edits a placeholder message with the partial agent output.
+    push() can be called from any thread, edits are throttled to one every _min_interval seconds
+    and intermediate texts are dropped, only the latest one is sent.
+    """
+    _min_interval: float = 1.0  # seconds, Telegram allows roughly one edit per second per chat
+
+    def __init__(self, message: Message, min_interval: Optional[float] = None):
+        self.message = message
+        self.min_interval = min_interval if min_interval is not None else self._min_interval
+        self.loop = asyncio.get_running_loop()
+        self.text: Optional[str] = None
+        self.sent_text: Optional[str] = None
+        self.last_edit: float = 0
+        self.task: Optional[asyncio.Task] = None
+        self.closed = False
+
+    def push(self, text: str):
+        self.loop.call_soon_threadsafe(self._set_text, text)
+
+    def _set_text(self, text: str):
+        if self.closed:
+            return
+        self.text = text[:MessageLimit.MAX_TEXT_LENGTH]
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._flush())
+
+    async def _flush(self):
+        while not self.closed and self.text != self.sent_text:
+            wait = self.last_edit + self.min_interval - self.loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            text = self.text
+            try:
+                await self.message.edit_text(text)
+            except RetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+                continue
+            except TelegramError as e:
+                print(f"Unable to update the streamed reply: {e}")
+            self.sent_text = text
+            self.last_edit = self.loop.time()
+
+    async def close(self):
+        self.closed = True
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
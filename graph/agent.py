@@ -1,15 +1,22 @@
-from typing import List, Any, Dict
-from langchain_openai import ChatOpenAI
+import functools
+import threading
+from typing import List, Any, Dict, Callable, Optional, Set
 from langchain.prompts import MessagesPlaceholder, ChatPromptTemplate
 from langchain.schema import Document, SystemMessage
 from langchain.schema.runnable import RunnableSerializable
-from langchain_core.utils.function_calling import convert_to_openai_function
 from langgraph.prebuilt import ToolExecutor
+from graph.context import ContextWindow
+from graph import shared
 from graph.graph import Graph
+from graph.memory import RollingSummaryMemory
 from graph.nodes import Nodes
 from graph.response import Response
+from graph.stream import AGENT_MODEL_TAG
+from graph.tool_selector import ToolSelector
 from settings.user_settings import UserSettings
 from tools.tools_manager import ToolsManager
+import blocking
+import resources
 import utils
 from vectorstore.vector_store_wrapper import VectorStoreWrapper
 
@@ -20,25 +27,48 @@ class AgentWrapper:
     _agent_max_iterations: int = 30
     _agent_max_execution_time: int = 60  # seconds
     _openai_timeout: int = 40  # seconds
+    _max_tool_concurrency: int = 4
     _memory_key: str = "memory"
+    _memory_mode: str = "summary"
+    _db_path: str = "./production_database"
 
-    def __init__(self, openai_api_key: str, user_id: str):
+    def __init__(self, openai_api_key: str, user_id: str, context_budget: Optional[int] = None,
+                 memory_mode: Optional[str] = None, docstore_backend: Optional[str] = None,
+                 tool_min_score: Optional[float] = None, tool_score_margin: Optional[float] = None):
         self.openai_api_key = openai_api_key
         self.user_id = user_id
-        self.llm = ChatOpenAI(
-            openai_api_key=self.openai_api_key,
+        self.llm = resources.get_llm(
+            self.openai_api_key,
             model=utils.AGENT_MODEL,
             temperature=self._temperature,
-            request_timeout=self._openai_timeout)
-        self.db = VectorStoreWrapper(self.openai_api_key, self.user_id)
+            request_timeout=self._openai_timeout,
+            streaming=True,
+            # streamed responses carry the token usage only when asked for
+            stream_usage=True)
+        self.db = VectorStoreWrapper(self.openai_api_key, self.user_id, docstore_backend)
+        self.db_tool = self.db.as_tool(self.llm)
         user_settings = UserSettings(self.user_id)
         self.tools_manager = ToolsManager(self.openai_api_key, self.user_id, user_settings)
-        self.tools, self.tool_executor = self.init_tools(self.tools_manager, self.llm, self.db)
+        # feature commands run outside the queue of the user, they change the tools one at a time
+        # and a turn reads the tools it starts with as a whole
+        self.lock = threading.Lock()
+        self.tools, self.tool_executor = self.init_tools(self.tools_manager, self.llm)
         self.model = self.init_model(self.tools)
-        self.nodes = Nodes(self.model, self.tool_executor)
-        self.graph = Graph(self.nodes)
+        self.tool_selector = ToolSelector(self.db.embeddings, min_score=tool_min_score,
+                                          score_margin=tool_score_margin)
+        self.context = ContextWindow(utils.AGENT_MODEL, context_budget)
+        self.nodes = Nodes(self.model, self.tool_executor, self._max_tool_concurrency, self.context)
+        self.conversations = resources.get_conversation_store(self._db_path)
+        self.graph = Graph(self.nodes, self._agent_max_iterations, self._agent_max_execution_time,
+                           memory=self.init_memory(memory_mode or self._memory_mode),
+                           store=self.conversations, user_id=self.user_id)
 
     def init_model(self, tools) -> RunnableSerializable:
+        # shared with the other users having the same tools
+        return shared.get_bound_model(self.llm, list(tools) + [Response], self.build_model)
+
+    @staticmethod
+    def build_model(llm, f_tools) -> RunnableSerializable:
         prompt = ChatPromptTemplate.from_messages(
             [
                 (
@@ -51,31 +81,87 @@ class AgentWrapper:
                 MessagesPlaceholder(variable_name="messages", optional=False)
             ]
         )
-        f_tools = [convert_to_openai_function(t) for t in tools]
-        f_tools.append(convert_to_openai_function(Response))
         return (
                 {
                     "memory": lambda x: x["memory"],
                     "messages": lambda x: x["messages"],
                 }
                 | prompt
-                | self.llm.bind_tools(tools=f_tools)
-        )
+                | llm.bind_tools(tools=f_tools)
+        ).with_config(tags=[AGENT_MODEL_TAG])
+
+    def init_memory(self, memory_mode: str):
+        if memory_mode == "window":
+            # None lets the graph keep its window of raw turns
+            return None
+        summary_llm = resources.get_llm(self.openai_api_key, model=utils.AGENT_MODEL, temperature=self._temperature,
+                                        request_timeout=self._openai_timeout)
+        return RollingSummaryMemory(summary_llm, k=self._max_win_memory, memory_key=self._memory_key,
+                                    on_summary=functools.partial(self.conversations.append_summary, self.user_id))
 
-    def init_tools(self, tool_manager, llm, db):
-        tools = [db.as_tool(llm)] + tool_manager.get_user_tools(llm=llm)
+    def init_tools(self, tool_manager, llm):
+        tools = [self.db_tool] + tool_manager.get_user_tools(llm=llm)
         return tools, ToolExecutor(tools)
 
     def re_init_agent(self):
-        user_settings = UserSettings(self.user_id)
-        self.tools_manager = ToolsManager(self.openai_api_key, self.user_id, user_settings)
-        self.tools, self.tool_executor = self.init_tools(self.tools_manager, self.llm, self.db)
+        # the tools manager only rebuilds the tools whose settings changed
+        tools, tool_executor = self.init_tools(self.tools_manager, self.llm)
+        if len(tools) == len(self.tools) and all(t is c for t, c in zip(tools, self.tools)):
+            return
+        self.tools, self.tool_executor = tools, tool_executor
         self.model = self.init_model(self.tools)
-        self.nodes = Nodes(self.model, self.tool_executor)
-        self.graph = Graph(self.nodes)
+        # the compiled graph (and its memory) is kept, only the nodes dependencies are swapped
+        self.nodes.model = self.model
+        self.nodes.tool_executor = self.tool_executor
+
+    def get_excluded_tools(self) -> Set[str]:
+        # nothing to search until the user uploads a document
+        return {self.db_tool.name} if self.db.is_empty() else set()
+
+    def get_turn_tools(self):
+        with self.lock:
+            return self.tools_manager.get_intent_handlers(), self.tools, self.tool_executor
+
+    def select_model(self, question: str, tools) -> RunnableSerializable:
+        tools = self.tool_selector.select(question, tools, self.get_excluded_tools())
+        return self.init_model(tools)
+
+    async def aselect_model(self, question: str, tools) -> RunnableSerializable:
+        excluded = await blocking.run_blocking(self.get_excluded_tools)
+        tools = await self.tool_selector.aselect(question, tools, excluded)
+        return self.init_model(tools)
+
+    def run(self, question: str, on_update: Optional[Callable[[str], None]] = None) -> dict[str, Any | None]:
+        handlers, tools, tool_executor = self.get_turn_tools()
+        # simple commands recognized by the tools are answered without the agent
+        for handler in handlers:
+            output = handler.handle(question)
+            if output:
+                return self.intent_response(question, output)
+        output = self.graph.run(question, on_update, model=self.select_model(question, tools),
+                                tool_executor=tool_executor)
+        for handler in handlers:
+            handler.on_response(question, output)
+        return output
+
+    async def arun(self, question: str, on_update: Optional[Callable[[str], None]] = None) -> dict[str, Any | None]:
+        # the lock is held by the feature commands while they rebuild the tools, it is never waited for on the loop
+        handlers, tools, tool_executor = await blocking.run_blocking(self.get_turn_tools)
+        for handler in handlers:
+            output = await handler.ahandle(question)
+            if output:
+                await self.graph.aload_memory()
+                return self.intent_response(question, output)
+        output = await self.graph.arun(question, on_update, model=await self.aselect_model(question, tools),
+                                       tool_executor=tool_executor)
+        for handler in handlers:
+            handler.on_response(question, output)
+        return output
 
-    def run(self, question: str) -> dict[str, Any | None]:
-        return self.graph.run(question)
+    def intent_response(self, question: str, output: Dict[str, Any]) -> dict[str, Any | None]:
+        # kept in memory so that follow-ups ("turn it on again") still have the context
+        self.graph.save_context(question, output["response"])
+        return output
 
     def add_document(self, docs: List[Document], msg_id: int, **kwargs: Any):
         self.db.add_document(docs, msg_id, **kwargs)
@@ -87,14 +173,16 @@ class AgentWrapper:
         return self.tools_manager.get_tool_required_parameters(tool_name)
 
     def enable_feature(self, tool_name: str, values: Dict[str, str]):
-        self.tools_manager.set_tool_parameters(tool_name, values)
-        # Recreate the agent with new enabled tools
-        self.re_init_agent()
+        with self.lock:
+            self.tools_manager.set_tool_parameters(tool_name, values)
+            # Recreate the agent with new enabled tools
+            self.re_init_agent()
 
     def disable_feature(self, tool_name: str):
-        self.tools_manager.disable_tool(tool_name)
-        # Recreate the agent without disabled tool
-        self.re_init_agent()
+        with self.lock:
+            self.tools_manager.disable_tool(tool_name)
+            # Recreate the agent without disabled tool
+            self.re_init_agent()
 
     def get_features_status(self):
         return self.tools_manager.get_tools_status()
@@ -103,6 +191,7 @@ class AgentWrapper:
         return self.tools_manager.get_available_tools_functions()
 
     def call_feature_command(self, tool_name: str, command: str):
-        self.tools_manager.call_tool_function(tool_name=tool_name, function_name=command)
-        # Recreate the agent with the updated data
-        self.re_init_agent()
+        with self.lock:
+            self.tools_manager.call_tool_function(tool_name=tool_name, function_name=command)
+            # Recreate the agent with the updated data
+            self.re_init_agent()
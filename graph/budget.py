@@ -0,0 +1,112 @@
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Awaitable, Callable, Optional
+
+# blocking model and tool calls run here so that the graph can stop waiting for them at the deadline,
+# one thread per agent worker: a turn waits on one call at a time
+_max_workers: int = 16
+_executor: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+# deadline of the turn the current call belongs to, read by the clients to cap their own timeouts
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("deadline", default=None)
+# a request started right at the deadline still gets the time to fail cleanly
+_min_timeout: float = 1.0  # seconds
+
+
+class TurnBudgetExceeded(Exception):
+    """ the turn ran out of its wall clock budget """
+
+    def __init__(self, message: str, abandoned: bool = False, running: Optional[str] = None):
+        super().__init__(message)
+        # the call was left running after the deadline, its effects may still happen
+        self.abandoned = abandoned
+        # what is still running, as told to the user
+        self.running = running
+
+
+def configure(max_workers: Optional[int] = None):
+    global _max_workers, _executor
+    with _lock:
+        if max_workers and max_workers != _max_workers:
+            _max_workers = max_workers
+            _executor = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=_max_workers, thread_name_prefix="agent-budget")
+        return _executor
+
+
+def get_deadline(max_execution_time: Optional[float]) -> Optional[float]:
+    return time.monotonic() + max_execution_time if max_execution_time else None
+
+
+def get_remaining(deadline: Optional[float]) -> Optional[float]:
+    if deadline is None:
+        return None
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise TurnBudgetExceeded("deadline reached")
+    return remaining
+
+
+def get_timeout(default: float) -> float:
+    """ timeout of a LLM or HTTP request: the default, capped by what is left of the turn budget """
+    deadline = _deadline.get()
+    if deadline is None:
+        return default
+    return max(min(default, deadline - time.monotonic()), _min_timeout)
+
+
+def _run(deadline: Optional[float], func: Callable[..., Any], *args, **kwargs) -> Any:
+    _deadline.set(deadline)
+    return func(*args, **kwargs)
+
+
+def call_with_deadline(deadline: Optional[float], func: Callable[..., Any], *args,
+                       grace: float = 0.0, **kwargs) -> Any:
+    """
+    grace extends the wait past the deadline for calls with side effects, their requests are capped by
+    the deadline through get_timeout and normally end within it
+    """
+    remaining = get_remaining(deadline)
+    # the context carries the callbacks of the run and the stats of the turn
+    context = contextvars.copy_context()
+    if remaining is None:
+        return context.run(_run, deadline, func, *args, **kwargs)
+    future = _get_executor().submit(context.run, _run, deadline, func, *args, **kwargs)
+    try:
+        return future.result(timeout=remaining + grace)
+    except FutureTimeoutError:
+        name = getattr(func, "__name__", func)
+        # a call still waiting for a thread never runs, its effects can't happen after the answer
+        if future.cancel():
+            raise TurnBudgetExceeded("{} not started at the deadline".format(name))
+        # a running thread can't be stopped, the caller reports the call as still running
+        raise TurnBudgetExceeded("{} still running at the deadline".format(name), abandoned=True)
+
+
+async def acall_with_deadline(deadline: Optional[float], func: Callable[..., Awaitable[Any]], *args,
+                              grace: float = 0.0, cancel: bool = True, **kwargs) -> Any:
+    """ with cancel=False the call is left running past the deadline instead of being interrupted mid-request """
+    remaining = get_remaining(deadline)
+    token = _deadline.set(deadline)
+    try:
+        # the task copies the context, and the deadline with it, when it is created
+        task = asyncio.ensure_future(func(*args, **kwargs))
+    finally:
+        _deadline.reset(token)
+    try:
+        return await asyncio.wait_for(task if cancel else asyncio.shield(task),
+                                      timeout=None if remaining is None else remaining + grace)
+    except asyncio.TimeoutError:
+        name = getattr(func, "__name__", func)
+        if cancel:
+            raise TurnBudgetExceeded("{} cancelled at the deadline".format(name))
+        raise TurnBudgetExceeded("{} still running at the deadline".format(name), abandoned=True)
@@ -0,0 +1,114 @@
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import tiktoken
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+
+from metrics.registry import registry
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+class ContextWindow:
+    """
+    Keeps memory and scratchpad of the agent within a token budget.
+    Tool outputs are truncated when they are created, when the budget is still exceeded the oldest
+    memory turns are dropped and then the tool outputs of the previous iterations are shortened.
+    The current question and the messages of the last iteration are always sent as they are.
+    """
+    # prompt tokens per model, well below the context windows: prompt size drives latency and cost
+    BUDGETS: Dict[str, int] = {
+        "gpt-4o": 12000,
+        "gpt-4o-mini": 12000,
+        "gpt-4-turbo": 12000,
+        "gpt-3.5-turbo": 6000,
+    }
+    _default_budget: int = 6000
+    _max_tool_tokens: int = 2000
+    _old_tool_tokens: int = 200
+    _message_overhead: int = 4  # tokens added by the chat format to every message
+
+    def __init__(self, model: str, budget: Optional[int] = None, max_tool_tokens: Optional[int] = None):
+        self.model = model
+        self.budget = budget or self.BUDGETS.get(model, self._default_budget)
+        self.max_tool_tokens = max_tool_tokens or self._max_tool_tokens
+        self.encoding = _get_encoding(model)
+
+    def count(self, text: str) -> int:
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def count_message(self, message: BaseMessage) -> int:
+        tokens = self._message_overhead
+        if isinstance(message.content, str):
+            tokens += self.count(message.content)
+        for tool_call in message.additional_kwargs.get("tool_calls", []):
+            tokens += self.count(tool_call["function"]["name"]) + self.count(tool_call["function"]["arguments"])
+        return tokens
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        tokens = self.encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        return "{}\n[truncated, {} tokens omitted]".format(self.encoding.decode(tokens[:max_tokens]),
+                                                           len(tokens) - max_tokens)
+
+    def truncate_tool_output(self, text: str) -> str:
+        truncated = self.truncate(text, self.max_tool_tokens)
+        if truncated is not text:
+            registry.inc("context_truncations_total", kind="tool_output")
+        return truncated
+
+    def fit(self, memory: Sequence[BaseMessage],
+            messages: Sequence[BaseMessage]) -> Tuple[List[BaseMessage], List[BaseMessage]]:
+        memory, messages = list(memory), list(messages)
+        memory_tokens = [self.count_message(m) for m in memory]
+        messages_tokens = [self.count_message(m) for m in messages]
+        total = sum(memory_tokens) + sum(messages_tokens)
+        # the oldest turns go first, a leading summary is the most compact context and is dropped last
+        start = 1 if memory and isinstance(memory[0], SystemMessage) else 0
+        while total > self.budget and memory:
+            # whole turns are dropped, a question is never left without its answer or the other way round
+            index = start if len(memory) > start else 0
+            end = _get_turn_end(memory, index)
+            del memory[index:end]
+            total -= sum(memory_tokens[index:end])
+            del memory_tokens[index:end]
+            registry.inc("context_truncations_total", kind="memory")
+        if total > self.budget:
+            last_iteration = _get_last_iteration(messages)
+            for i, message in enumerate(messages[:last_iteration]):
+                if total <= self.budget:
+                    break
+                if not isinstance(message, ToolMessage) or not isinstance(message.content, str):
+                    continue
+                content = self.truncate(message.content, self._old_tool_tokens)
+                if content is message.content:
+                    continue
+                messages[i] = message.copy(update=dict(content=content))
+                tokens = self.count_message(messages[i])
+                total -= messages_tokens[i] - tokens
+                messages_tokens[i] = tokens
+                registry.inc("context_truncations_total", kind="scratchpad")
+        return memory, messages
+
+
+def _get_turn_end(memory: Sequence[BaseMessage], index: int) -> int:
+    """ index of the next question after the one at index, the turn ends there """
+    for i in range(index + 1, len(memory)):
+        if isinstance(memory[i], HumanMessage):
+            return i
+    return len(memory)
+
+
+def _get_last_iteration(messages: Sequence[BaseMessage]) -> int:
+    """ index of the last model message, the tool outputs following it are needed to answer """
+    for i in range(len(messages) - 1, -1, -1):
+        if isinstance(messages[i], AIMessage):
+            return i
+    return len(messages)
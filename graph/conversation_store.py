@@ -0,0 +1,68 @@
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+from vectorstore.sqlite_pool import get_connection
+
+Turn = Tuple[str, str]
+
+
+class ConversationStore:
+    """
+    Append-only history of the conversations: turns and the rolling summaries, one row each, per user.
+    SQLite in WAL mode lets more bot processes read the same history while one of them writes.
+    Writes are queued to a single background thread so that a turn never waits for the disk.
+    """
+    _db_file_name: str = "conversations.sqlite3"
+    _max_load_turns: int = 50
+
+    def __init__(self, db_path: str):
+        self.path = os.path.join(db_path, self._db_file_name)
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="conversation-writer")
+        self._create_tables()
+
+    def _get_connection(self) -> sqlite3.Connection:
+        return get_connection(self.path)
+
+    def _create_tables(self):
+        with self._get_connection() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS turns ("
+                               "id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL, "
+                               "question TEXT NOT NULL, answer TEXT NOT NULL, created REAL NOT NULL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS turns_user ON turns (user_id, id)")
+            # folded is the number of turns of the user covered by the summary
+            connection.execute("CREATE TABLE IF NOT EXISTS summaries ("
+                               "id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL, "
+                               "summary TEXT NOT NULL, folded INTEGER NOT NULL, created REAL NOT NULL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS summaries_user ON summaries (user_id, id)")
+
+    def append_turn(self, user_id: str, question: str, answer: str):
+        self.writer.submit(self._write, "INSERT INTO turns (user_id, question, answer, created) VALUES (?, ?, ?, ?)",
+                           (user_id, question, answer, time.time()))
+
+    def append_summary(self, user_id: str, summary: str, folded: int):
+        self.writer.submit(self._write, "INSERT INTO summaries (user_id, summary, folded, created) VALUES (?, ?, ?, ?)",
+                           (user_id, summary, folded, time.time()))
+
+    def _write(self, query: str, params: tuple):
+        try:
+            with self._get_connection() as connection:
+                connection.execute(query, params)
+        except sqlite3.Error as e:
+            print("Conversation store write failed: {}".format(e))
+
+    def load(self, user_id: str, max_turns: Optional[int] = None) -> Tuple[str, int, List[Turn]]:
+        """ returns the last summary, the number of turns before the returned ones and the turns after it """
+        max_turns = max_turns or self._max_load_turns
+        connection = self._get_connection()
+        row = connection.execute("SELECT summary, folded FROM summaries WHERE user_id = ? ORDER BY id DESC LIMIT 1",
+                                 (user_id,)).fetchone()
+        summary, folded = row if row else ("", 0)
+        total, = connection.execute("SELECT COUNT(*) FROM turns WHERE user_id = ?", (user_id,)).fetchone()
+        # turns not folded yet, the oldest ones are skipped if the summary fell too far behind
+        offset = max(folded, total - max_turns)
+        turns = connection.execute("SELECT question, answer FROM turns WHERE user_id = ? ORDER BY id LIMIT -1 OFFSET ?",
+                                   (user_id, offset)).fetchall()
+        return summary, offset, [(question, answer) for question, answer in turns]
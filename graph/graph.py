@@ -1,52 +1,176 @@
 import json
+import threading
+from typing import Callable, Optional
 
-from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
+from langchain_core.runnables import Runnable, RunnableConfig, RunnableLambda
+from langgraph.errors import GraphRecursionError
 from langgraph.graph import StateGraph, END
+from langgraph.prebuilt import ToolExecutor
 
+import blocking
+from graph.budget import TurnBudgetExceeded, get_deadline
+from graph.conversation_store import ConversationStore
+from graph.memory import RollingSummaryMemory
 from graph.nodes import Nodes
 from graph.state import AgentState
+from graph.stream import StreamCallbackHandler, tools_progress
+from metrics.callbacks import MetricsCallbackHandler, TurnStats, current_turn
+from metrics.registry import registry
 from langchain.memory import ConversationBufferWindowMemory
 
 
+_compiled_graph = None
+_compile_lock = threading.Lock()
+
+
+def _get_nodes(config: RunnableConfig) -> Nodes:
+    return config["configurable"]["nodes"]
+
+
+def _call_model(state: AgentState, config: RunnableConfig):
+    return _get_nodes(config).call_model(state, config["configurable"].get("model"))
+
+
+async def _acall_model(state: AgentState, config: RunnableConfig):
+    return await _get_nodes(config).acall_model(state, config["configurable"].get("model"))
+
+
+def _call_tool(state: AgentState, config: RunnableConfig):
+    return _get_nodes(config).call_tool(state, config["configurable"].get("tool_executor"))
+
+
+async def _acall_tool(state: AgentState, config: RunnableConfig):
+    return await _get_nodes(config).acall_tool(state, config["configurable"].get("tool_executor"))
+
+
 class Graph:
     RUN_NAME = "TelegramBot"
+    BUDGET_MESSAGE = "I couldn't complete your request in time, please try again with a more specific question."
+    COMPLETED_MESSAGE = "These actions were completed: {tools}."
+    RUNNING_MESSAGE = "These actions were still running and may still complete: {tools}."
+    _max_iterations: int = 30
+    _max_execution_time: int = 60  # seconds
+    _window_turns: int = 10
 
-    def __init__(self, nodes: Nodes):
+    def __init__(self, nodes: Nodes, max_iterations: Optional[int] = None, max_execution_time: Optional[int] = None,
+                 memory=None, store: Optional[ConversationStore] = None, user_id: Optional[str] = None):
         self.nodes = nodes
+        self.max_iterations = max_iterations or self._max_iterations
+        self.max_execution_time = max_execution_time or self._max_execution_time
         self.graph = self.create_graph()
-        self.memory = ConversationBufferWindowMemory(memory_key="memory",
-                                                     return_messages=True,
-                                                     k=10)
-
-    def create_graph(self):
-        graph = StateGraph(AgentState)
-        graph.add_node("agent", self.nodes.call_model)
-        graph.add_node("action", self.nodes.call_tool)
-
-        graph.set_entry_point("agent")
-        graph.add_conditional_edges(
-            "agent",
-            self.nodes.should_continue,
-            {
-                "continue": "action",
-                "end": END,
-            }
-        )
-        graph.add_edge("action", "agent")
-        return graph.compile()
-
-    def run(self, input_message):
+        self.memory = memory or ConversationBufferWindowMemory(memory_key="memory",
+                                                               return_messages=True,
+                                                               k=self._window_turns)
+        # the stored history is loaded by the first turn, then every turn is appended to it
+        self.store = store
+        self.user_id = user_id
+        self.memory_loaded = store is None
+
+    @staticmethod
+    def create_graph():
+        # the topology is the same for every user: compiled once, the nodes of the user come with the config
+        global _compiled_graph
+        with _compile_lock:
+            if _compiled_graph is not None:
+                return _compiled_graph
+            graph = StateGraph(AgentState)
+            # both the sync and the native async implementations are registered, run() and arun() pick the right one
+            graph.add_node("agent", RunnableLambda(_call_model, afunc=_acall_model))
+            graph.add_node("action", RunnableLambda(_call_tool, afunc=_acall_tool))
+
+            graph.set_entry_point("agent")
+            graph.add_conditional_edges(
+                "agent",
+                Nodes.should_continue,
+                {
+                    "continue": "action",
+                    "end": END,
+                }
+            )
+            graph.add_edge("action", "agent")
+            _compiled_graph = graph.compile()
+            return _compiled_graph
+
+    def run(self, input_message, on_update: Optional[Callable[[str], None]] = None,
+            model: Optional[Runnable] = None, tool_executor: Optional[ToolExecutor] = None):
+        self._load_memory()
+        turn = TurnStats()
+        inputs, config = self._get_inputs(input_message, turn, on_update, model, tool_executor)
+        output = None
+        token = current_turn.set(turn)
+        try:
+            for step in self.graph.with_config(dict(run_name=Graph.RUN_NAME)).stream(inputs, config=config):
+                output = self._process_step(step, turn, on_update)
+        except (TurnBudgetExceeded, GraphRecursionError) as e:
+            return self._get_partial_response(input_message, output or inputs, e)
+        finally:
+            current_turn.reset(token)
+            turn.record()
+        return self._get_response(input_message, output)
+
+    async def arun(self, input_message, on_update: Optional[Callable[[str], None]] = None,
+                   model: Optional[Runnable] = None, tool_executor: Optional[ToolExecutor] = None):
+        await self.aload_memory()
+        turn = TurnStats()
+        inputs, config = self._get_inputs(input_message, turn, on_update, model, tool_executor)
+        output = None
+        token = current_turn.set(turn)
+        try:
+            async for step in self.graph.with_config(dict(run_name=Graph.RUN_NAME)).astream(inputs, config=config):
+                output = self._process_step(step, turn, on_update)
+        except (TurnBudgetExceeded, GraphRecursionError) as e:
+            return self._get_partial_response(input_message, output or inputs, e)
+        finally:
+            current_turn.reset(token)
+            turn.record()
+        return self._get_response(input_message, output)
+
+    async def aload_memory(self):
+        """ the stored history is read on the worker pool, save_context then finds it loaded """
+        if not self.memory_loaded:
+            await blocking.run_blocking(self._load_memory)
+
+    def _load_memory(self):
+        if self.memory_loaded:
+            return
+        summary, folded, turns = self.store.load(self.user_id)
+        if isinstance(self.memory, RollingSummaryMemory):
+            self.memory.restore(summary, folded, turns)
+        else:
+            for question, answer in turns[-self._window_turns:]:
+                self.memory.save_context(dict(input=question), dict(output=answer))
+        self.memory_loaded = True
+
+    def save_context(self, input_message, response_message):
+        self._load_memory()
+        self.memory.save_context(dict(input=input_message), dict(output=response_message))
+        if self.store:
+            self.store.append_turn(self.user_id, input_message, response_message)
+
+    def _get_inputs(self, input_message, turn: TurnStats, on_update: Optional[Callable[[str], None]],
+                    model: Optional[Runnable] = None, tool_executor: Optional[ToolExecutor] = None):
         memory = self.memory.load_memory_variables({})['memory']
-        inputs = dict(messages=[HumanMessage(content=input_message)], memory=memory)
-        # final_output=dict()
-        # for output in self.graph.with_config(dict(run_name=Graph.RUN_NAME)).stream(inputs):
-        #     for key, value in output.items():
-        #         print(f"Output from node {key}:")
-        #         print("-------")
-        #         print(value)
-        #     final_output=output
-        #     print("-------")
-        output = self.graph.with_config(dict(run_name=Graph.RUN_NAME)).invoke(inputs)
+        inputs = dict(messages=[HumanMessage(content=input_message)], memory=memory,
+                      deadline=get_deadline(self.max_execution_time))
+        # every iteration runs the agent and the action nodes, plus the final agent step
+        config = dict(callbacks=[MetricsCallbackHandler(turn)], recursion_limit=2 * self.max_iterations + 1,
+                      configurable=dict(nodes=self.nodes, model=model, tool_executor=tool_executor))
+        if on_update:
+            config["callbacks"].append(StreamCallbackHandler(on_update))
+        return inputs, config
+
+    def _process_step(self, step, turn: TurnStats, on_update: Optional[Callable[[str], None]]):
+        output = None
+        for node, state in step.items():
+            if node == "agent":
+                turn.iterations += 1
+                if on_update:
+                    self._notify_tools_progress(state, on_update)
+            output = state
+        return output
+
+    def _get_response(self, input_message, output):
         response_message = ""
         message_id = None
         ai_message: AIMessage = output['messages'][-1]
@@ -60,8 +184,37 @@ class Graph:
                     message_id = result["message_id"]
         else:
             response_message = ai_message.content
-        self.memory.save_context(dict(input=input_message), dict(output=response_message))
-        return dict(response=response_message, message_id=message_id)
+        self.save_context(input_message, response_message)
+        return dict(response=response_message, message_id=message_id, tools=self._get_used_tools(output))
 
+    def _get_partial_response(self, input_message, state, error: Exception):
+        reason = "iterations" if isinstance(error, GraphRecursionError) else "time"
+        print("Turn stopped, {} budget exceeded: {}".format(reason, error))
+        registry.inc("agent_budget_exceeded_total", reason=reason)
+        # the text the model wrote before the budget ran out is still worth returning
+        partial = next((m.content for m in reversed(state["messages"])
+                        if isinstance(m, AIMessage) and isinstance(m.content, str) and m.content), "")
+        response_message = "{}\n\n{}".format(partial, self.BUDGET_MESSAGE) if partial else self.BUDGET_MESSAGE
+        # the user is told which tools ran, e.g. a device may have been switched even if the turn failed
+        completed = self._get_used_tools(state)
+        if completed:
+            response_message = "{}\n\n{}".format(response_message,
+                                                 self.COMPLETED_MESSAGE.format(tools=", ".join(completed)))
+        running = getattr(error, "running", None)
+        if running:
+            response_message = "{}\n\n{}".format(response_message, self.RUNNING_MESSAGE.format(tools=running))
+        self.save_context(input_message, response_message)
+        return dict(response=response_message, message_id=None)
 
+    @staticmethod
+    def _get_used_tools(output):
+        return sorted({message.name for message in output["messages"] if isinstance(message, ToolMessage)})
 
+    @staticmethod
+    def _notify_tools_progress(state, on_update: Callable[[str], None]):
+        last_message = state["messages"][-1]
+        tool_names = [tool_call["function"]["name"]
+                      for tool_call in last_message.additional_kwargs.get("tool_calls", [])
+                      if tool_call["function"]["name"] != "Response"]
+        if tool_names:
+            on_update(tools_progress(tool_names))
@@ -0,0 +1,110 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+# summaries are updated after the reply has been returned, never on the path of a turn
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="memory-summary")
+
+SUMMARY_PROMPT = """Progressively summarize the conversation between a user and an AI assistant, \
+adding the new lines to the current summary. Keep names, facts, decisions and pending requests, \
+drop greetings and details that are not needed to continue the conversation. Reply only with the new summary.
+
+Current summary:
+{summary}
+
+New lines:
+{lines}
+
+New summary:"""
+
+
+class RollingSummaryMemory:
+    """
+    Keeps the last k turns verbatim, the older ones are folded into a summary updated in background.
+    Exposes the load_memory_variables/save_context methods used by the graph, like the langchain memories.
+    """
+    _k: int = 3
+
+    def __init__(self, llm: BaseChatModel, k: Optional[int] = None, memory_key: str = "memory",
+                 on_summary: Optional[Callable[[str, int], None]] = None):
+        self.llm = llm
+        self.k = k or self._k
+        self.memory_key = memory_key
+        # called with the new summary and the number of turns it covers
+        self.on_summary = on_summary
+        self.summary = ""
+        self.folded = 0
+        self.turns: List[Tuple[str, str]] = []
+        # turns out of the window not yet folded into the summary
+        self.pending: List[Tuple[str, str]] = []
+        self.summarizing = False
+        self.lock = threading.Lock()
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, List[BaseMessage]]:
+        with self.lock:
+            summary, turns = self.summary, self.pending + self.turns
+        messages: List[BaseMessage] = []
+        if summary:
+            messages.append(SystemMessage(content="Summary of the earlier conversation:\n{}".format(summary)))
+        for question, answer in turns:
+            messages.append(HumanMessage(content=question))
+            messages.append(AIMessage(content=answer))
+        return {self.memory_key: messages}
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]):
+        with self.lock:
+            self.turns.append((inputs["input"], outputs["output"]))
+            self._schedule()
+
+    def restore(self, summary: str, folded: int, turns: List[Tuple[str, str]]):
+        """
+        loads a stored history, the turns are the ones following the first folded turns.
+        The stored summary is reused as it is: turns it doesn't cover yet are folded with the next saved turn,
+        loading an agent (e.g. after an eviction) never calls the model
+        """
+        with self.lock:
+            self.summary = summary
+            self.folded = folded
+            self.turns = list(turns)
+            self.pending = []
+            self._shift()
+
+    def _shift(self):
+        # called holding the lock
+        while len(self.turns) > self.k:
+            self.pending.append(self.turns.pop(0))
+
+    def _schedule(self):
+        # called holding the lock
+        self._shift()
+        if not self.pending or self.summarizing:
+            return
+        self.summarizing = True
+        _executor.submit(self._summarize)
+
+    def _summarize(self):
+        while True:
+            with self.lock:
+                summary, pending = self.summary, list(self.pending)
+                if not pending:
+                    self.summarizing = False
+                    return
+            lines = "\n".join("User: {}\nAI: {}".format(q, a) for q, a in pending)
+            try:
+                new_summary = self.llm.invoke(SUMMARY_PROMPT.format(summary=summary or "(empty)", lines=lines)).content
+            except Exception as e:
+                # the pending turns are still sent verbatim, the next saved turn retries
+                print("Memory summary failed: {}".format(e))
+                with self.lock:
+                    self.summarizing = False
+                return
+            with self.lock:
+                self.summary = new_summary
+                self.folded += len(pending)
+                folded = self.folded
+                del self.pending[:len(pending)]
+            if self.on_summary:
+                self.on_summary(new_summary, folded)
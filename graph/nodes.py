@@ -1,19 +1,31 @@
 import json
+from contextlib import contextmanager
+from typing import Optional
 
 from langchain_core.messages import FunctionMessage, ToolMessage
 from langchain_core.runnables import RunnableSerializable
 from langgraph.prebuilt import ToolInvocation, ToolExecutor
 
+from graph.budget import TurnBudgetExceeded, acall_with_deadline, call_with_deadline
+from graph.context import ContextWindow
 from graph.state import AgentState
+from metrics.registry import registry
 
 
 class Nodes:
+    _max_tool_concurrency: int = 4
+    # tools may change the state of devices, they are waited for a bit past the deadline rather than abandoned
+    _tool_grace: float = 10  # seconds
 
-    def __init__(self, model: RunnableSerializable, tool_executor: ToolExecutor):
+    def __init__(self, model: RunnableSerializable, tool_executor: ToolExecutor,
+                 max_tool_concurrency: Optional[int] = None, context: Optional[ContextWindow] = None):
         self.model = model
         self.tool_executor = tool_executor
+        self.max_tool_concurrency = max_tool_concurrency or self._max_tool_concurrency
+        self.context = context
 
-    def should_continue(self, state: AgentState):
+    @staticmethod
+    def should_continue(state: AgentState):
         last_message = state["messages"][-1]
         if "tool_calls" not in last_message.additional_kwargs:
             return "end"
@@ -25,22 +37,92 @@ class Nodes:
         else:
             return "continue"
 
-    def call_model(self, state: AgentState):
+    def call_model(self, state: AgentState, model: Optional[RunnableSerializable] = None):
         messages = state["messages"]
-        memory = state["memory"]
-        response = self.model.invoke({"messages": messages, "memory": memory})
+        # model bound to the tools selected for the turn, all the tools otherwise
+        model = model or self.model
+        with registry.timer("agent_node_seconds", node="agent"):
+            response = call_with_deadline(state.get("deadline"), model.invoke, self._get_prompt_inputs(state))
         messages.append(response)
         return dict(messages=messages)
 
-    def call_tool(self, state: AgentState):
+    async def acall_model(self, state: AgentState, model: Optional[RunnableSerializable] = None):
         messages = state["messages"]
-        last_message = messages[-1]
-        for tool_call in last_message.additional_kwargs["tool_calls"]:
-            action = ToolInvocation(
-                tool=tool_call["function"]["name"],
-                tool_input=json.loads(tool_call["function"]["arguments"])
-            )
-            response = self.tool_executor.invoke(action)
-            function_message = ToolMessage(content=str(response), name=action.tool, tool_call_id=tool_call["id"])
+        model = model or self.model
+        with registry.timer("agent_node_seconds", node="agent"):
+            response = await acall_with_deadline(state.get("deadline"), model.ainvoke,
+                                                 self._get_prompt_inputs(state))
+        messages.append(response)
+        return dict(messages=messages)
+
+    def _get_prompt_inputs(self, state: AgentState):
+        memory, messages = state["memory"], state["messages"]
+        if self.context:
+            # the state keeps the full messages, only what is sent to the model is trimmed
+            memory, messages = self.context.fit(memory, messages)
+        return {"messages": messages, "memory": memory}
+
+    def call_tool(self, state: AgentState, tool_executor: Optional[ToolExecutor] = None):
+        tool_calls = state["messages"][-1].additional_kwargs["tool_calls"]
+        responses, actions, indexes = self._get_actions(tool_calls)
+        # executor of the tools the turn started with
+        tool_executor = tool_executor or self.tool_executor
+        # the tools of a single model turn run concurrently, a failure only affects its own message
+        with registry.timer("agent_node_seconds", node="action"), self._report_running(actions):
+            results = call_with_deadline(state.get("deadline"), tool_executor.batch, actions,
+                                         config=dict(max_concurrency=self.max_tool_concurrency),
+                                         return_exceptions=True, grace=self._tool_grace)
+        return self._add_tool_messages(state, tool_calls, responses, indexes, results)
+
+    async def acall_tool(self, state: AgentState, tool_executor: Optional[ToolExecutor] = None):
+        tool_calls = state["messages"][-1].additional_kwargs["tool_calls"]
+        responses, actions, indexes = self._get_actions(tool_calls)
+        tool_executor = tool_executor or self.tool_executor
+        with registry.timer("agent_node_seconds", node="action"), self._report_running(actions):
+            results = await acall_with_deadline(state.get("deadline"), tool_executor.abatch, actions,
+                                                config=dict(max_concurrency=self.max_tool_concurrency),
+                                                return_exceptions=True, grace=self._tool_grace, cancel=False)
+        return self._add_tool_messages(state, tool_calls, responses, indexes, results)
+
+    @staticmethod
+    @contextmanager
+    def _report_running(actions):
+        try:
+            yield
+        except TurnBudgetExceeded as e:
+            if not e.abandoned:
+                raise
+            # the tools are named in the answer, the user knows their effects may still happen
+            raise TurnBudgetExceeded(str(e), abandoned=True,
+                                     running=", ".join(sorted({a.tool for a in actions}))) from e
+
+    @staticmethod
+    def _get_actions(tool_calls):
+        responses = [None] * len(tool_calls)
+        actions = []
+        indexes = []
+        for i, tool_call in enumerate(tool_calls):
+            try:
+                tool_input = json.loads(tool_call["function"]["arguments"] or "{}")
+            except ValueError as e:
+                responses[i] = e
+                continue
+            actions.append(ToolInvocation(tool=tool_call["function"]["name"], tool_input=tool_input))
+            indexes.append(i)
+        return responses, actions, indexes
+
+    def _add_tool_messages(self, state: AgentState, tool_calls, responses, indexes, results):
+        messages = state["messages"]
+        for i, result in zip(indexes, results):
+            responses[i] = result
+        for tool_call, response in zip(tool_calls, responses):
+            name = tool_call["function"]["name"]
+            if isinstance(response, Exception):
+                print("Tool {} failed: {}".format(name, response))
+                response = "Error while running the tool {}: {}".format(name, response)
+            content = str(response)
+            if self.context:
+                content = self.context.truncate_tool_output(content)
+            function_message = ToolMessage(content=content, name=name, tool_call_id=tool_call["id"])
             messages.append(function_message)
         return dict(messages=messages, memory=state["memory"])
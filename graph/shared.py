@@ -0,0 +1,43 @@
+import threading
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+from langchain_core.runnables import Runnable
+from langchain_core.utils.function_calling import convert_to_openai_function
+
+# Function schemas and bound models only depend on the tool set, they are built once and shared by all the users.
+# Per-user state (memory, tools instances, settings) never ends up here.
+
+_lock = threading.Lock()
+_schemas: Dict[Tuple, Dict[str, Any]] = dict()
+_models: Dict[Tuple, Runnable] = dict()
+
+
+def _get_schema_key(tool: Any) -> Tuple:
+    if isinstance(tool, type):
+        return (tool,)
+    return type(tool), tool.name, tool.description, tool.args_schema
+
+
+def get_function_schema(tool: Any) -> Dict[str, Any]:
+    key = _get_schema_key(tool)
+    with _lock:
+        schema = _schemas.get(key)
+    if schema is None:
+        schema = convert_to_openai_function(tool)
+        with _lock:
+            schema = _schemas.setdefault(key, schema)
+    return schema
+
+
+def get_bound_model(llm: Any, tools: Sequence[Any],
+                    build: Callable[[Any, List[Dict[str, Any]]], Runnable]) -> Runnable:
+    """ build receives the llm and the function schemas of the tools, it runs once per llm and tool set """
+    # the llms are shared by resources.get_llm and live as long as the process
+    key = (id(llm),) + tuple(_get_schema_key(t) for t in tools)
+    with _lock:
+        model = _models.get(key)
+    if model is None:
+        model = build(llm, [get_function_schema(t) for t in tools])
+        with _lock:
+            model = _models.setdefault(key, model)
+    return model
@@ -1,4 +1,4 @@
-from typing import TypedDict, Sequence
+from typing import Optional, TypedDict, Sequence
 
 from langchain.memory.chat_memory import BaseChatMemory
 from langchain_core.messages import BaseMessage
@@ -7,3 +7,5 @@ from langchain_core.messages import BaseMessage
 class AgentState(TypedDict):
     messages: Sequence[BaseMessage]
     memory: BaseChatMemory
+    # time.monotonic() value after which the turn stops
+    deadline: Optional[float]
@@ -0,0 +1,94 @@
+import json
+import re
+from typing import Callable, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# tag attached to the agent model, tokens coming from the LLMs used inside the tools are not streamed
+AGENT_MODEL_TAG = "agent_model"
+
+TOOLS_PROGRESS = {
+    "document-extractor": "searching documents…",
+    "home_assistant_agent": "calling home assistant…",
+    "home_assistant_status": "calling home assistant…",
+    "home_assistant_action": "calling home assistant…",
+    "entities-extractor": "searching home assistant entities…",
+    "duckduckgo_search": "searching the web…",
+    "GoogleSearch": "searching the web…",
+    "movies-retriever": "searching movies…",
+    "netflix_id_discovery": "searching netflix…",
+    "netflix_player": "starting the movie…",
+}
+
+_OUTPUT_PATTERN = re.compile(r'"output"\s*:\s*"')
+
+
+def tools_progress(tool_names: List[str]) -> str:
+    labels = []
+    for name in tool_names:
+        label = TOOLS_PROGRESS.get(name, "running {}…".format(name))
+        if label not in labels:
+            labels.append(label)
+    return "\n".join(labels)
+
+
+def partial_response_output(arguments: str) -> str:
+    """ extract the (possibly incomplete) 'output' value from the streamed arguments of the Response tool """
+    match = _OUTPUT_PATTERN.search(arguments)
+    if not match:
+        return ""
+    raw = arguments[match.end():]
+    chars = []
+    i = 0
+    while i < len(raw):
+        c = raw[i]
+        if c == '\\':
+            # keep escapes only once they are complete
+            size = 6 if raw[i + 1:i + 2] == 'u' else 2
+            if i + size > len(raw):
+                break
+            chars.append(raw[i:i + size])
+            i += size
+            continue
+        if c == '"':
+            break
+        chars.append(c)
+        i += 1
+    try:
+        return json.loads('"{}"'.format(''.join(chars)))
+    except ValueError:
+        return ""
+
+
+class StreamCallbackHandler(BaseCallbackHandler):
+    """ forwards the answer of the agent model to on_update while its tokens arrive """
+
+    def __init__(self, on_update: Callable[[str], None]):
+        self.on_update = on_update
+        self.content = ""
+        self.response_arguments = ""
+        self.response_index: Optional[int] = None
+
+    def on_chat_model_start(self, serialized, messages, *, tags: Optional[List[str]] = None, **kwargs):
+        if AGENT_MODEL_TAG in (tags or []):
+            self.content = ""
+            self.response_arguments = ""
+            self.response_index = None
+
+    def on_llm_new_token(self, token: str, *, chunk=None, tags: Optional[List[str]] = None, **kwargs):
+        if AGENT_MODEL_TAG not in (tags or []):
+            return
+        if token:
+            self.content += token
+        message = getattr(chunk, "message", None)
+        for tool_chunk in getattr(message, "tool_call_chunks", None) or []:
+            if tool_chunk.get("name") == "Response":
+                self.response_index = tool_chunk.get("index")
+            if self.response_index is not None and tool_chunk.get("index") == self.response_index:
+                self.response_arguments += tool_chunk.get("args") or ""
+        if self.response_index is not None:
+            text = partial_response_output(self.response_arguments)
+        else:
+            text = self.content
+        if text:
+            self.on_update(text)
@@ -0,0 +1,89 @@
+import threading
+from typing import Collection, Dict, List, Optional, Sequence
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.tools import BaseTool
+
+from metrics.registry import registry
+from vectorstore.similarity import cosine
+
+
+def _get_description(tool: BaseTool) -> str:
+    return "{}: {}".format(tool.name, " ".join(tool.description.split()))
+
+
+class ToolSelector:
+    """
+    Picks the tools bound to the model for a turn by similarity between the question and the tool descriptions.
+    Excluded tools (e.g. the documents one when nothing was uploaded) are never bound,
+    when no tool is clearly relevant all the remaining ones are bound.
+    The embedding scores sit in a narrow range (ada-002 rates unrelated texts around 0.7-0.75), besides the
+    absolute min_score a tool is kept only within score_margin of the best one.
+    The best score of each turn is exported as tool_selection_score to tune both on real questions.
+    """
+    _top_k: int = 3
+    _min_score: float = 0.8
+    _score_margin: float = 0.05
+    # the descriptions are the same for every user, their embeddings are computed once per process
+    _vectors: Dict[str, List[float]] = dict()
+    _lock = threading.Lock()
+
+    def __init__(self, embeddings: Embeddings, top_k: Optional[int] = None, min_score: Optional[float] = None,
+                 score_margin: Optional[float] = None):
+        self.embeddings = embeddings
+        self.top_k = top_k or self._top_k
+        self.min_score = self._min_score if min_score is None else min_score
+        self.score_margin = self._score_margin if score_margin is None else score_margin
+
+    def select(self, query: str, tools: Sequence[BaseTool], excluded: Collection[str] = ()) -> List[BaseTool]:
+        candidates = [t for t in tools if t.name not in excluded]
+        if len(candidates) <= self.top_k:
+            return self._selected(candidates, "all")
+        try:
+            missing = self._get_missing(candidates)
+            if missing:
+                self._store(missing, self.embeddings.embed_documents(missing))
+            query_vector = self.embeddings.embed_query(query)
+        except Exception as e:
+            print("Tool selection failed, binding all the tools: {}".format(e))
+            return self._selected(candidates, "error")
+        return self._rank(candidates, query_vector)
+
+    async def aselect(self, query: str, tools: Sequence[BaseTool], excluded: Collection[str] = ()) -> List[BaseTool]:
+        candidates = [t for t in tools if t.name not in excluded]
+        if len(candidates) <= self.top_k:
+            return self._selected(candidates, "all")
+        try:
+            missing = self._get_missing(candidates)
+            if missing:
+                self._store(missing, await self.embeddings.aembed_documents(missing))
+            query_vector = await self.embeddings.aembed_query(query)
+        except Exception as e:
+            print("Tool selection failed, binding all the tools: {}".format(e))
+            return self._selected(candidates, "error")
+        return self._rank(candidates, query_vector)
+
+    def _get_missing(self, tools: Sequence[BaseTool]) -> List[str]:
+        with self._lock:
+            return list(dict.fromkeys(d for d in map(_get_description, tools) if d not in self._vectors))
+
+    def _store(self, descriptions: List[str], vectors: List[List[float]]):
+        with self._lock:
+            self._vectors.update(zip(descriptions, vectors))
+
+    def _rank(self, tools: Sequence[BaseTool], query_vector: List[float]) -> List[BaseTool]:
+        with self._lock:
+            scores = [cosine(query_vector, self._vectors[_get_description(t)]) for t in tools]
+        best = max(scores)
+        registry.observe("tool_selection_score", best)
+        if best < self.min_score:
+            return self._selected(tools, "fallback")
+        ranked = sorted(range(len(tools)), key=lambda i: scores[i], reverse=True)[:self.top_k]
+        ranked = [i for i in ranked if scores[i] >= best - self.score_margin]
+        # the original order is kept, the bound model is then shared by the users selecting the same tools
+        return self._selected([t for i, t in enumerate(tools) if i in ranked], "top_k")
+
+    @staticmethod
+    def _selected(tools: Sequence[BaseTool], result: str) -> List[BaseTool]:
+        registry.inc("tool_selections_total", result=result)
+        return list(tools)
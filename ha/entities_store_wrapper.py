@@ -1,13 +1,11 @@
 from typing import List
-from langchain_openai import OpenAIEmbeddings
 from langchain.prompts import PromptTemplate
 from langchain.schema import Document
 from langchain.tools import Tool
-from langchain_community.vectorstores import Chroma
 from langchain.agents.agent_toolkits import create_retriever_tool
 import logging
 from langchain.retrievers.multi_query import MultiQueryRetriever
-import utils
+import resources
 from ha.ha_handler import HAHandler
 
 
@@ -28,14 +26,14 @@ class EntitiesStoreWrapper:
         _set_logger()
         self.openai_api_key = openai_api_key
         self.user_id = user_id
-        self.embeddings = OpenAIEmbeddings(openai_api_key=self.openai_api_key, model=utils.EMBEDDINGS_MODEL)
+        self.embeddings = resources.get_embeddings(self.openai_api_key)
         self.ha_handler = ha_handler
         self._init_db()
 
     def _init_db(self):
-        self.db = Chroma(persist_directory=self.db_path,
-                         embedding_function=self.embeddings,
-                         collection_name="entities_{}".format(self.user_id))
+        self.db = resources.get_vectorstore(self.db_path,
+                                            "entities_{}".format(self.user_id),
+                                            self.embeddings)
 
     def add_document(self, documents: List[Document]):
         self.db.add_documents(documents)
@@ -28,5 +28,11 @@ class HaActionTool(BaseTool):
         else:
             return "Error, the action {} has not been executed on {}".format(action, entity_id)
 
-    def _arun(self, entity_id: str, entity_type: str, action: str):
-        raise NotImplementedError("home_assistant_action does not support async")
+    async def _arun(self, entity_id: str, entity_type: str, action: str):
+        ha_handler: HAHandler = self.metadata["ha_handler"]
+        res = await ha_handler.aset_state(entity_type=entity_type, entity_id=entity_id, action=action)
+        message = "The action {} has been executed on {}".format(action, entity_id)
+        if res:
+            return message
+        else:
+            return "Error, the action {} has not been executed on {}".format(action, entity_id)
@@ -1,8 +1,11 @@
 import json
+import httpx
 import requests
 from urllib.parse import urljoin
 from typing import Dict, List
 from langchain.schema import Document
+import resources
+from metrics.registry import registry
 
 # Tech debit - I don't really want to expose all the entities (e.g. the light of a wall switch)
 # I have more than 1000 entities, select what to keep is a mess, would be nice, maybe, to add a prefix
@@ -74,6 +77,12 @@ class HAHandler:
             if entity["entity_id"] == entity_id:
                 return entity["state"]
 
+    async def aget_entity_status(self, entity_id: str) -> str:
+        entities = await self.aget_entities()
+        for entity in entities or []:
+            if entity["entity_id"] == entity_id:
+                return entity["state"]
+
     def get_entity_attributes(self, entity_id: str):
         entities = self.get_entities()
         for entity in entities:
@@ -93,40 +102,81 @@ class HAHandler:
     def get_services(self):
         return self.get_json_from_url(urljoin(self.url, self._services))
 
+    async def aget_entities(self):
+        return await self.aget_json_from_url(urljoin(self.url, self._states))
+
+    def get_headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.bearer_token}",
+            "Content-Type": "application/json"
+        }
+
     def get_json_from_url(self, url):
         try:
-            headers = {
-                "Authorization": f"Bearer {self.bearer_token}",
-                "Content-Type": "application/json"
-            }
-
-            response = requests.get(url, headers=headers)
+            headers = self.get_headers()
+            with registry.timer("http_request_seconds", integration="home_assistant"):
+                response = requests.get(url, headers=headers, timeout=resources.get_http_timeout())
             if response.status_code == 200:
                 json_data = response.json()
                 return json_data
             else:
                 print(f"Request failed with status code: {response.status_code}")
+                registry.inc("http_errors_total", integration="home_assistant")
                 return None
         except requests.exceptions.RequestException as e:
             print(f"An error occurred during the request: {e}")
+            registry.inc("http_errors_total", integration="home_assistant")
+            return None
+
+    async def aget_json_from_url(self, url):
+        try:
+            with registry.timer("http_request_seconds", integration="home_assistant"):
+                response = await resources.get_async_http_client().get(url, headers=self.get_headers())
+            if response.status_code == 200:
+                return response.json()
+            else:
+                print(f"Request failed with status code: {response.status_code}")
+                registry.inc("http_errors_total", integration="home_assistant")
+                return None
+        except httpx.HTTPError as e:
+            print(f"An error occurred during the request: {e}")
+            registry.inc("http_errors_total", integration="home_assistant")
             return None
 
     def set_state(self, entity_type: str, action: str, entity_id: str) -> bool:
         url = urljoin(self.url, "{}/{}/{}".format(self._services, entity_type, action))
         try:
-            headers = {
-                "Authorization": f"Bearer {self.bearer_token}",
-                "Content-Type": "application/json"
-            }
+            headers = self.get_headers()
             data = {
                 "entity_id": entity_id
             }
-            response = requests.post(url, headers=headers, data=json.dumps(data))
+            with registry.timer("http_request_seconds", integration="home_assistant"):
+                response = requests.post(url, headers=headers, data=json.dumps(data),
+                                         timeout=resources.get_http_timeout())
             if response.status_code == 200:
                 return True
             else:
                 print(f"Request failed with status code: {response.status_code}")
+                registry.inc("http_errors_total", integration="home_assistant")
                 return False
         except requests.exceptions.RequestException as e:
             print(f"An error occurred during the request: {e}")
+            registry.inc("http_errors_total", integration="home_assistant")
+            return False
+
+    async def aset_state(self, entity_type: str, action: str, entity_id: str) -> bool:
+        url = urljoin(self.url, "{}/{}/{}".format(self._services, entity_type, action))
+        try:
+            with registry.timer("http_request_seconds", integration="home_assistant"):
+                response = await resources.get_async_http_client().post(url, headers=self.get_headers(),
+                                                                        json={"entity_id": entity_id})
+            if response.status_code == 200:
+                return True
+            else:
+                print(f"Request failed with status code: {response.status_code}")
+                registry.inc("http_errors_total", integration="home_assistant")
+                return False
+        except httpx.HTTPError as e:
+            print(f"An error occurred during the request: {e}")
+            registry.inc("http_errors_total", integration="home_assistant")
             return False
@@ -24,5 +24,10 @@ class HAStatusTool(BaseTool):
                     "maybe the configuration is wrong")
         return f"The entity status is {status}"#. Properties associated to this entity are {attributes}"
 
-    def _arun(self, entity_id: str):
-        raise NotImplementedError("home_assistant_status does not support async")
+    async def _arun(self, entity_id: str):
+        ha_handler: HAHandler = self.metadata["ha_handler"]
+        status = await ha_handler.aget_entity_status(entity_id)
+        if not status:
+            return ("Error while connecting to the home-assistant instance, "
+                    "maybe the configuration is wrong")
+        return f"The entity status is {status}"
@@ -0,0 +1,129 @@
+import re
+import threading
+import time
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+from ha.ha_handler import HAHandler
+from metrics.registry import registry
+from tools.intent_handler import IntentHandler
+
+# (pattern, action, language), the target is the name of a single entity
+COMMANDS = [
+    (re.compile(r"^(?:please\s+)?(?:turn|switch)\s+(?P<action>on|off)\s+(?:the\s+)?(?P<target>.+?)(?:\s+please)?$"),
+     None, "en"),
+    (re.compile(r"^(?:please\s+)?(?:turn|switch)\s+(?:the\s+)?(?P<target>.+?)\s+(?P<action>on|off)(?:\s+please)?$"),
+     None, "en"),
+    (re.compile(r"^(?:per\s+favore\s+)?accendi\s+(?:il\s+|lo\s+|la\s+|i\s+|gli\s+|le\s+|l\s+)?(?P<target>.+?)"
+                r"(?:\s+per\s+favore)?$"), "on", "it"),
+    (re.compile(r"^(?:per\s+favore\s+)?spegni\s+(?:il\s+|lo\s+|la\s+|i\s+|gli\s+|le\s+|l\s+)?(?P<target>.+?)"
+                r"(?:\s+per\s+favore)?$"), "off", "it"),
+]
+REPLIES = dict(
+    en=dict(on="Done, {name} is on.", off="Done, {name} is off."),
+    it=dict(on="Fatto, ho acceso {name}.", off="Fatto, ho spento {name}."),
+)
+DOMAINS = {"light", "switch", "fan", "input_boolean"}
+STOPWORDS = {"the", "il", "lo", "la", "l", "i", "gli", "le", "di", "del", "della", "dello", "dei", "delle", "in"}
+
+
+def _normalize(text: str) -> str:
+    return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+
+def _get_tokens(text: str) -> FrozenSet[str]:
+    return frozenset(t for t in _normalize(text).split() if t not in STOPWORDS)
+
+
+class HAIntentHandler(IntentHandler):
+    """
+    Answers simple on/off commands without the agent: the command is matched with local patterns
+    and the target against the names of the entities, the service is called only when exactly one entity matches.
+    Anything else returns None and goes to the agent.
+    """
+    _index_ttl: int = 300  # seconds
+
+    def __init__(self, ha_handler: HAHandler):
+        self.ha_handler = ha_handler
+        # entity_id -> (friendly name, tokens of the friendly name, tokens of the object id)
+        self.index: Dict[str, Tuple[str, FrozenSet[str], FrozenSet[str]]] = dict()
+        # None until the entities are loaded once
+        self.index_time: Optional[float] = None
+        self.lock = threading.Lock()
+
+    def handle(self, query: str) -> Optional[Dict[str, Any]]:
+        command = self.parse(query)
+        if command is None:
+            return None
+        if self._is_expired():
+            self._set_index(self.ha_handler.get_entities())
+        entity = self._match(command[1])
+        if entity is None:
+            return self._miss()
+        action, _, language = command
+        entity_id, name = entity
+        if not self.ha_handler.set_state(entity_id.split(".")[0], "turn_{}".format(action), entity_id):
+            return self._miss()
+        return self._reply(language, action, name)
+
+    async def ahandle(self, query: str) -> Optional[Dict[str, Any]]:
+        command = self.parse(query)
+        if command is None:
+            return None
+        if self._is_expired():
+            self._set_index(await self.ha_handler.aget_entities())
+        entity = self._match(command[1])
+        if entity is None:
+            return self._miss()
+        action, _, language = command
+        entity_id, name = entity
+        if not await self.ha_handler.aset_state(entity_id.split(".")[0], "turn_{}".format(action), entity_id):
+            return self._miss()
+        return self._reply(language, action, name)
+
+    @staticmethod
+    def parse(query: str) -> Optional[Tuple[str, str, str]]:
+        text = _normalize(query)
+        for pattern, action, language in COMMANDS:
+            match = pattern.match(text)
+            if match:
+                return action or match.group("action"), match.group("target"), language
+        return None
+
+    def _match(self, target: str) -> Optional[Tuple[str, str]]:
+        tokens = _get_tokens(target)
+        if not tokens:
+            return None
+        with self.lock:
+            matches = [(entity_id, name) for entity_id, (name, name_tokens, id_tokens) in self.index.items()
+                       if tokens == name_tokens or tokens == id_tokens]
+        # ambiguous targets (e.g. "the lights") are left to the agent
+        return matches[0] if len(matches) == 1 else None
+
+    def _is_expired(self) -> bool:
+        with self.lock:
+            return self.index_time is None or time.monotonic() - self.index_time > self._index_ttl
+
+    def _set_index(self, entities: Optional[List[Dict]]):
+        if entities is None:
+            return
+        index = dict()
+        for entity in entities:
+            entity_id = entity["entity_id"]
+            domain, object_id = entity_id.split(".", 1)
+            if domain not in DOMAINS:
+                continue
+            name = entity.get("attributes", {}).get("friendly_name") or object_id
+            index[entity_id] = (name, _get_tokens(name), _get_tokens(object_id.replace("_", " ")))
+        with self.lock:
+            self.index = index
+            self.index_time = time.monotonic()
+
+    @staticmethod
+    def _reply(language: str, action: str, name: str) -> Dict[str, Any]:
+        registry.inc("intent_fast_path_total", integration="home_assistant", result="hit")
+        return dict(response=REPLIES[language][action].format(name=name), message_id=None)
+
+    @staticmethod
+    def _miss() -> None:
+        registry.inc("intent_fast_path_total", integration="home_assistant", result="miss")
+        return None
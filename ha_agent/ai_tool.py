@@ -24,5 +24,10 @@ class HAAgentAITool(BaseTool):
                     "maybe the configuration is wrong")
         return f"The response status is {status}"#. Properties associated to this entity are {attributes}"
 
-    def _arun(self, entity_id: str):
-        raise NotImplementedError("home_assistant_status does not support async")
+    async def _arun(self, sentence: str):
+        ha_agent_query: HAAgentQuery = self.metadata["ha_agent_query"]
+        status = await ha_agent_query.aquery_sentence(sentence)
+        if not status:
+            return ("Error while connecting to the home-assistant instance, "
+                    "maybe the configuration is wrong")
+        return f"The response status is {status}"
@@ -1,4 +1,7 @@
+import httpx
 import requests
+import resources
+from metrics.registry import registry
 
 class HAAgentQuery:
 
@@ -10,26 +13,53 @@ class HAAgentQuery:
         return self.query_sentence(self.url, sentence=sentence)
 
 
+    def get_headers(self):
+        return {
+            "Authorization": f"Bearer {self.bearer_token}",
+            "Content-Type": "application/json"
+        }
+
+    @staticmethod
+    def get_payload(sentence):
+        return {
+            "text": sentence,
+            "conversation_id": "tel-doc-bot",
+            "agent_id": "conversation.chatgpt"
+        }
+
     def query_sentence(self, sentence):
         try:
-            headers = {
-                "Authorization": f"Bearer {self.bearer_token}",
-                "Content-Type": "application/json"
-            }
-
-            response = requests.post(f"{self.url}/api/conversation/process", 
-                                     json={
-                                         "text": sentence,
-                                         "conversation_id": "tel-doc-bot",
-                                         "agent_id": "conversation.chatgpt"
-                                     },
-                                     headers=headers)
+            with registry.timer("http_request_seconds", integration="home_assistant"):
+                response = requests.post(f"{self.url}/api/conversation/process",
+                                         json=self.get_payload(sentence),
+                                         headers=self.get_headers(),
+                                         timeout=resources.get_http_timeout())
             if response.status_code == 200:
                 json_data = response.json()
                 return json_data
             else:
                 print(f"Request failed with status code: {response.status_code}")
+                registry.inc("http_errors_total", integration="home_assistant")
                 return None
         except requests.exceptions.RequestException as e:
             print(f"An error occurred during the request: {e}")
+            registry.inc("http_errors_total", integration="home_assistant")
+            return None
+
+    async def aquery_sentence(self, sentence):
+        try:
+            with registry.timer("http_request_seconds", integration="home_assistant"):
+                response = await resources.get_async_http_client().post(f"{self.url}/api/conversation/process",
+                                                                        json=self.get_payload(sentence),
+                                                                        headers=self.get_headers(),
+                                                                        timeout=resources.get_http_timeout())
+            if response.status_code == 200:
+                return response.json()
+            else:
+                print(f"Request failed with status code: {response.status_code}")
+                registry.inc("http_errors_total", integration="home_assistant")
+                return None
+        except httpx.HTTPError as e:
+            print(f"An error occurred during the request: {e}")
+            registry.inc("http_errors_total", integration="home_assistant")
             return None
@@ -0,0 +1,141 @@
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from graph.context import ContextWindow
+from metrics.registry import registry
+
+
+class TurnStats:
+    """ counters of a single agent turn """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.iterations = 0
+        self.llm_calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cache_hits = 0
+
+    def record(self):
+        registry.inc("agent_turns_total")
+        registry.observe("agent_turn_seconds", time.perf_counter() - self.start)
+        registry.observe("agent_turn_iterations", self.iterations)
+        registry.observe("agent_turn_tokens", self.prompt_tokens, type="prompt")
+        registry.observe("agent_turn_tokens", self.completion_tokens, type="completion")
+        registry.observe("agent_turn_cache_hits", self.cache_hits)
+
+
+# stats of the turn being executed, copied into the worker threads and tasks started by the graph
+current_turn: ContextVar[Optional[TurnStats]] = ContextVar("current_turn", default=None)
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """ times LLM, tool and retriever runs and counts the tokens used by the turn """
+
+    def __init__(self, turn: TurnStats):
+        self.turn = turn
+        self.starts: Dict[UUID, float] = dict()
+        self.names: Dict[UUID, str] = dict()
+        self.streamed_tokens: Dict[UUID, int] = dict()
+        self.prompts: Dict[UUID, Any] = dict()
+
+    def _start(self, run_id: UUID, name: str):
+        self.starts[run_id] = time.perf_counter()
+        self.names[run_id] = name
+
+    def _stop(self, run_id: UUID):
+        start = self.starts.pop(run_id, None)
+        name = self.names.pop(run_id, "unknown")
+        return name, (time.perf_counter() - start) if start is not None else None
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs: Any):
+        self._start(run_id, _get_name(serialized, kwargs, "llm"))
+        # counted only when the response has no usage
+        self.prompts[run_id] = messages
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, **kwargs: Any):
+        self._start(run_id, _get_name(serialized, kwargs, "llm"))
+        self.prompts[run_id] = prompts
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any):
+        self.streamed_tokens[run_id] = self.streamed_tokens.get(run_id, 0) + 1
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any):
+        name, elapsed = self._stop(run_id)
+        if elapsed is not None:
+            registry.observe("llm_call_seconds", elapsed, model=name)
+        prompt_tokens, completion_tokens = _get_usage(response)
+        streamed = self.streamed_tokens.pop(run_id, 0)
+        prompt = self.prompts.pop(run_id, None)
+        if prompt_tokens is None:
+            # a response without usage (e.g. streamed by a client not asking for it), the prompt is counted here
+            prompt_tokens = _count_prompt(name, prompt)
+        if completion_tokens is None:
+            # each streamed chunk is a token
+            completion_tokens = streamed
+        self.turn.llm_calls += 1
+        self.turn.prompt_tokens += prompt_tokens
+        self.turn.completion_tokens += completion_tokens
+        registry.inc("llm_tokens_total", prompt_tokens, type="prompt")
+        registry.inc("llm_tokens_total", completion_tokens, type="completion")
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._stop(run_id)
+        self.streamed_tokens.pop(run_id, None)
+        self.prompts.pop(run_id, None)
+
+    def on_tool_start(self, serialized, input_str: str, *, run_id: UUID, **kwargs: Any):
+        self._start(run_id, _get_name(serialized, kwargs, "tool"))
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any):
+        name, elapsed = self._stop(run_id)
+        if elapsed is not None:
+            registry.observe("tool_call_seconds", elapsed, tool=name)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        name, _ = self._stop(run_id)
+        registry.inc("tool_errors_total", tool=name)
+
+    def on_retriever_start(self, serialized, query: str, *, run_id: UUID, **kwargs: Any):
+        self._start(run_id, _get_name(serialized, kwargs, "retriever"))
+
+    def on_retriever_end(self, documents, *, run_id: UUID, **kwargs: Any):
+        name, elapsed = self._stop(run_id)
+        if elapsed is not None:
+            registry.observe("retriever_seconds", elapsed, retriever=name)
+
+    def on_retriever_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._stop(run_id)
+
+
+def _get_name(serialized: Optional[Dict[str, Any]], kwargs: Dict[str, Any], default: str) -> str:
+    serialized = serialized or dict()
+    invocation = kwargs.get("invocation_params") or dict()
+    return (invocation.get("model_name") or invocation.get("model") or kwargs.get("name")
+            or serialized.get("name") or (serialized.get("id") or [default])[-1])
+
+
+def _count_prompt(model: str, prompt) -> int:
+    if not prompt:
+        return 0
+    context = ContextWindow(model)
+    # lists of messages of the chat models, texts of the completion ones
+    return sum(context.count(item) if isinstance(item, str) else sum(map(context.count_message, item))
+               for item in prompt)
+
+
+def _get_usage(response):
+    llm_output = getattr(response, "llm_output", None) or dict()
+    usage = llm_output.get("token_usage")
+    if usage:
+        return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+    for generations in getattr(response, "generations", None) or []:
+        for generation in generations:
+            metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if metadata:
+                return metadata.get("input_tokens", 0), metadata.get("output_tokens", 0)
+    return None, None
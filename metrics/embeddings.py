@@ -0,0 +1,33 @@
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+from metrics.registry import registry
+
+
+class InstrumentedEmbeddings(Embeddings):
+    """ times the requests sent to the wrapped embeddings model """
+
+    def __init__(self, embeddings: Embeddings, model: str):
+        self.embeddings = embeddings
+        self.model = model
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        registry.inc("embedding_texts_total", len(texts), model=self.model)
+        with registry.timer("embedding_seconds", model=self.model):
+            return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        registry.inc("embedding_texts_total", model=self.model)
+        with registry.timer("embedding_seconds", model=self.model):
+            return self.embeddings.embed_query(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        registry.inc("embedding_texts_total", len(texts), model=self.model)
+        with registry.timer("embedding_seconds", model=self.model):
+            return await self.embeddings.aembed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        registry.inc("embedding_texts_total", model=self.model)
+        with registry.timer("embedding_seconds", model=self.model):
+            return await self.embeddings.aembed_query(text)
@@ -0,0 +1,155 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+LabelsKey = Tuple[Tuple[str, str], ...]
+
+HELP = dict(
+    agent_turns_total="Agent turns completed",
+    agent_turn_seconds="Wall time of an agent turn",
+    agent_turn_iterations="Agent node iterations of a turn",
+    agent_turn_tokens="Tokens used by a turn",
+    agent_turn_cache_hits="Tool cache hits of a turn",
+    agent_budget_exceeded_total="Agent turns stopped by the iterations or time budget",
+    agent_node_seconds="Wall time of a graph node",
+    llm_call_seconds="Wall time of a LLM call",
+    llm_tokens_total="LLM tokens used",
+    tool_call_seconds="Wall time of a tool call",
+    tool_selections_total="Tools selections of the agent turns by result",
+    tool_selection_score="Best similarity between the question and the tool descriptions",
+    tool_errors_total="Tool calls failed",
+    tool_cache_requests_total="Tool cache lookups",
+    tool_cache_skipped_total="Tool results not cached because the call failed",
+    retriever_seconds="Wall time of a retriever call",
+    embedding_seconds="Wall time of an embeddings request",
+    embedding_texts_total="Texts sent to the embeddings model",
+    embedding_cache_requests_total="Texts looked up in the embeddings cache",
+    ingestion_chunks_total="Document chunks indexed by result",
+    ingestion_chunk_seconds="Wall time of a document chunk through generation, embedding and store writes",
+    http_request_seconds="Wall time of an outbound HTTP request",
+    http_errors_total="Outbound HTTP requests failed",
+    intent_fast_path_total="Commands matched by the local intent handlers, hit when answered without the agent",
+    answer_cache_requests_total="Answer cache lookups",
+    agents_resident="Agents kept in memory",
+    agents_evicted_total="Agents evicted because of the max_agents limit",
+    agents_expired_total="Agents dropped after the idle TTL",
+    context_truncations_total="Tool outputs, memory turns and scratchpad messages trimmed to fit the context budget",
+    tool_cache_entries="Entries in the tool results cache",
+)
+
+
+class MetricsRegistry:
+    """ thread-safe counters, gauges and histograms exported in the Prometheus text format """
+    _buckets: Sequence[float] = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: Dict[str, Dict[LabelsKey, float]] = dict()
+        self.histograms: Dict[str, Dict[LabelsKey, List[float]]] = dict()
+        self.buckets: Dict[str, Sequence[float]] = dict()
+        self.gauges: Dict[str, Callable[[], Dict[LabelsKey, float]]] = dict()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = _labels_key(labels)
+        with self.lock:
+            values = self.counters.setdefault(name, dict())
+            values[key] = values.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = _labels_key(labels)
+        with self.lock:
+            buckets = self.buckets.setdefault(name, self._buckets)
+            values = self.histograms.setdefault(name, dict())
+            # one counter per bucket followed by sum and count
+            series = values.setdefault(key, [0] * (len(buckets) + 2))
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def set_buckets(self, name: str, buckets: Sequence[float]):
+        with self.lock:
+            self.buckets[name] = tuple(buckets)
+
+    def gauge(self, name: str, func: Callable[[], float], **labels):
+        key = _labels_key(labels)
+        with self.lock:
+            previous = self.gauges.get(name)
+
+            def collect():
+                values = previous() if previous else dict()
+                values[key] = func()
+                return values
+
+            self.gauges[name] = collect
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def render(self) -> str:
+        lines = []
+        with self.lock:
+            for name, values in sorted(self.counters.items()):
+                _header(lines, name, "counter")
+                for key, value in values.items():
+                    lines.append("{}{} {}".format(name, _format_labels(key), _format_value(value)))
+            for name, func in sorted(self.gauges.items()):
+                _header(lines, name, "gauge")
+                for key, value in func().items():
+                    lines.append("{}{} {}".format(name, _format_labels(key), _format_value(value)))
+            for name, values in sorted(self.histograms.items()):
+                _header(lines, name, "histogram")
+                buckets = self.buckets[name]
+                for key, series in values.items():
+                    for bound, count in zip(buckets, series):
+                        lines.append("{}_bucket{} {}".format(name, _format_labels(key, le=_format_value(bound)),
+                                                             _format_value(count)))
+                    lines.append("{}_bucket{} {}".format(name, _format_labels(key, le="+Inf"),
+                                                         _format_value(series[-1])))
+                    lines.append("{}_sum{} {}".format(name, _format_labels(key), _format_value(series[-2])))
+                    lines.append("{}_count{} {}".format(name, _format_labels(key), _format_value(series[-1])))
+        return "\n".join(lines) + "\n"
+
+
+def _labels_key(labels: Dict[str, object]) -> LabelsKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _header(lines: List[str], name: str, metric_type: str):
+    if name in HELP:
+        lines.append("# HELP {} {}".format(name, HELP[name]))
+    lines.append("# TYPE {} {}".format(name, metric_type))
+
+
+def _format_labels(key: LabelsKey, le: Optional[str] = None) -> str:
+    pairs = list(key)
+    if le is not None:
+        pairs.append(("le", le))
+    if not pairs:
+        return ""
+    escaped = ('{}="{}"'.format(k, v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+               for k, v in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, float) and math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+registry = MetricsRegistry()
+registry.set_buckets("agent_turn_iterations", (1, 2, 3, 5, 8, 13, 20, 30))
+registry.set_buckets("agent_turn_tokens", (500, 1000, 2000, 4000, 8000, 16000, 32000, 64000))
+registry.set_buckets("agent_turn_cache_hits", (0, 1, 2, 5, 10))
+registry.set_buckets("tool_selection_score", (0.7, 0.725, 0.75, 0.775, 0.8, 0.825, 0.85, 0.875, 0.9, 0.95))
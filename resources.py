@@ -0,0 +1,118 @@
+import asyncio
+import math
+import threading
+import weakref
+from typing import Any, Dict, Optional, Tuple
+
+import chromadb
+import httpx
+from langchain_community.vectorstores import Chroma
+from langchain_core.embeddings import Embeddings
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+import utils
+from graph.budget import get_timeout
+from graph.conversation_store import ConversationStore
+from metrics.embeddings import InstrumentedEmbeddings
+from vectorstore.embedding_cache import CachedEmbeddings, EmbeddingCache
+
+# Process wide clients shared by all the users, per-user state lives only in collection names and memory.
+# ChatOpenAI and OpenAIEmbeddings are stateless and thread-safe, a single persistent Chroma client is kept
+# per storage path so that the same SQLite file is not opened by concurrent clients.
+
+_lock = threading.Lock()
+_llms: Dict[Tuple, ChatOpenAI] = dict()
+_embeddings: Dict[Tuple, Embeddings] = dict()
+_chroma_clients: Dict[str, Any] = dict()
+_conversation_stores: Dict[str, ConversationStore] = dict()
+_embedding_cache_path: str = "./production_database"
+_embedding_caches: Dict[str, EmbeddingCache] = dict()
+# httpx async clients are bound to the event loop that created them
+_async_http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = \
+    weakref.WeakKeyDictionary()
+_http_timeout: int = 30  # seconds
+
+
+def _cap_timeout(value: Optional[float]) -> Optional[float]:
+    capped = get_timeout(math.inf if value is None else value)
+    return None if capped == math.inf else capped
+
+
+def _apply_deadline(request: httpx.Request):
+    # the timeouts of the request are capped by the budget left to the turn the request belongs to
+    timeout = request.extensions.get("timeout") or dict(connect=None, read=None, write=None, pool=None)
+    request.extensions["timeout"] = {key: _cap_timeout(value) for key, value in timeout.items()}
+
+
+async def _aapply_deadline(request: httpx.Request):
+    _apply_deadline(request)
+
+
+# used by the OpenAI clients, their requests don't outlive the turn
+_openai_http_client = httpx.Client(event_hooks=dict(request=[_apply_deadline]))
+_openai_async_http_client = httpx.AsyncClient(event_hooks=dict(request=[_aapply_deadline]))
+
+
+def get_http_timeout() -> float:
+    """ timeout of the blocking (requests) calls of the integrations """
+    return get_timeout(_http_timeout)
+
+
+def get_llm(openai_api_key: str, model: str = utils.AGENT_MODEL, **kwargs) -> ChatOpenAI:
+    key = (openai_api_key, model, tuple(sorted(kwargs.items())))
+    with _lock:
+        if key not in _llms:
+            _llms[key] = ChatOpenAI(openai_api_key=openai_api_key, model=model, http_client=_openai_http_client,
+                                    http_async_client=_openai_async_http_client, **kwargs)
+        return _llms[key]
+
+
+def get_embeddings(openai_api_key: str, model: str = utils.EMBEDDINGS_MODEL) -> Embeddings:
+    key = (openai_api_key, model)
+    with _lock:
+        if key not in _embeddings:
+            # only the texts missing from the cache reach (and are timed by) the OpenAI model
+            instrumented = InstrumentedEmbeddings(OpenAIEmbeddings(openai_api_key=openai_api_key, model=model), model)
+            _embeddings[key] = CachedEmbeddings(instrumented, model, _get_embedding_cache(_embedding_cache_path))
+        return _embeddings[key]
+
+
+def _get_embedding_cache(path: str) -> EmbeddingCache:
+    # called holding the lock
+    if path not in _embedding_caches:
+        _embedding_caches[path] = EmbeddingCache(path)
+    return _embedding_caches[path]
+
+
+def get_embedding_cache_stats() -> Dict[str, Dict[str, float]]:
+    with _lock:
+        return {path: cache.get_stats() for path, cache in _embedding_caches.items()}
+
+
+def get_chroma_client(path: str):
+    with _lock:
+        if path not in _chroma_clients:
+            _chroma_clients[path] = chromadb.PersistentClient(path=path)
+        return _chroma_clients[path]
+
+
+def get_conversation_store(path: str) -> ConversationStore:
+    with _lock:
+        if path not in _conversation_stores:
+            _conversation_stores[path] = ConversationStore(path)
+        return _conversation_stores[path]
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    with _lock:
+        if loop not in _async_http_clients:
+            _async_http_clients[loop] = httpx.AsyncClient(timeout=_http_timeout,
+                                                          event_hooks=dict(request=[_aapply_deadline]))
+        return _async_http_clients[loop]
+
+
+def get_vectorstore(path: str, collection_name: str, embeddings) -> Chroma:
+    return Chroma(client=get_chroma_client(path),
+                  embedding_function=embeddings,
+                  collection_name=collection_name)
@@ -1,8 +1,10 @@
 import io
 import logging
-from typing import Dict
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardRemove
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardRemove, Message
 from telegram.constants import ParseMode
+from telegram.error import BadRequest, TelegramError
 from telegram.ext import ApplicationBuilder, ContextTypes, CommandHandler, CallbackQueryHandler, ConversationHandler
 from telegram.ext import MessageHandler, filters
 from pathlib import Path
@@ -10,6 +12,12 @@ import gettext
 import locale
 import json
 from agent.ai_manager import AIManager
+import blocking
+from graph import budget
+from agent.request_queue import UserRequestQueue, UserQueueFullError
+from bot.reply_streamer import ReplyStreamer
+from metrics.server import start_metrics_server
+from vectorstore import ingestion
 from loader.text_extractor import AWSTextExtractor
 
 # process all for dir in $(ls -d locales/*);
@@ -23,21 +31,54 @@ logging.basicConfig(
 )
 
 config_file_path = 'configuration.json'
+locales_path = str(Path(__file__).parent / 'locales')
 CONFIGURE, STATUS, SWITCH, SETTING, DISABLE, COMMAND = range(6)
 
 
 class TelDocBot:
+    _max_workers: int = 16
+
     def __init__(self, configuration):
-        self.application = self.setup_application(configuration['telegram_bot_token'])
-        self.ai_manager = AIManager(configuration['openai_api_key'])
+        # native_async runs the agent turns on the event loop with the async tools
+        self.native_async = configuration.get('native_async', False)
+        # agent turns, uploads and feature commands do blocking I/O, they run here instead of on the event loop
+        max_workers = configuration.get('max_workers', self._max_workers)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="agent-worker")
+        # the model and tool calls of the turns, bounded by the deadline, get a thread per worker
+        budget.configure(max_workers)
+        # the blocking calls of the async paths share the same bounded pool
+        blocking.set_executor(self.executor)
+        ingestion.configure(configuration.get('ingest_concurrency'),
+                            chunk_size=configuration.get('chunk_size'),
+                            chunk_overlap=configuration.get('chunk_overlap'))
+        self.application = self.setup_application(configuration['telegram_bot_token'],
+                                                   configuration.get('telegram_base_url'))
+        self.ai_manager = AIManager(configuration['openai_api_key'],
+                                    max_agents=configuration.get('max_agents'),
+                                    agent_idle_ttl=configuration.get('agent_idle_ttl'),
+                                    context_budget=configuration.get('context_budget'),
+                                    memory_mode=configuration.get('memory_mode'),
+                                    docstore_backend=configuration.get('docstore_backend'),
+                                    tool_min_score=configuration.get('tool_min_score'),
+                                    tool_score_margin=configuration.get('tool_score_margin'))
+        self.request_queue = UserRequestQueue(self.ask,
+                                              max_depth=configuration.get('max_queue_depth'),
+                                              coalesce_window=configuration.get('coalesce_window'))
         self.aws_text_extractor = AWSTextExtractor(configuration['region_name'],
                                                    configuration['aws_access_key_id'],
                                                    configuration['aws_secret_access_key'], configuration
                                                    ['bucket_name'])
+        if configuration.get('metrics_port'):
+            start_metrics_server(configuration['metrics_port'])
+
+    def run(self):
         self.application.run_polling(allowed_updates=Update.ALL_TYPES)
 
-    def setup_application(self, bot_token: str):
-        application = ApplicationBuilder().token(bot_token).build()
+    def setup_application(self, bot_token: str, base_url: Optional[str] = None):
+        builder = ApplicationBuilder().token(bot_token).concurrent_updates(True)
+        if base_url:
+            builder = builder.base_url(base_url)
+        application = builder.build()
         start_handler = CommandHandler('start', self.start)
         doc_handler = MessageHandler(filters.Document.ALL, self.docs)
         questions_handler = MessageHandler(filters.ALL, self.questions)
@@ -84,8 +125,17 @@ class TelDocBot:
         file = await context.bot.get_file(update.message.document)
         memory_buffer = io.BytesIO(await file.download_as_bytearray())
         f_name = Path(file.file_path).name
-        docs = self.aws_text_extractor.process_document(memory_buffer, f_name)
-        self.ai_manager.process_document(update.effective_user.username, docs, update.message.id)
+        try:
+            docs = await blocking.run_blocking(self.aws_text_extractor.process_document, memory_buffer, f_name)
+            await blocking.run_blocking(self.ai_manager.process_document, update.effective_user.username, docs,
+                                        update.message.id)
+        except Exception as e:
+            # extraction, tokenizer download, LLM or store errors: the user is told the document is not indexed,
+            # the error (OpenAI bodies, file paths) only goes to the log
+            print("Upload of {} failed: {}".format(f_name, e))
+            await update.message.reply_text(self.get_message(update, "upload_failed"),
+                                            reply_to_message_id=update.message.id)
+            return
         await update.message.reply_text("👍", parse_mode=ParseMode.MARKDOWN, reply_to_message_id=update.message.id)
 
     async def questions(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -94,17 +144,48 @@ class TelDocBot:
                                                    parse_mode=ParseMode.MARKDOWN)
         await context.bot.send_chat_action(chat_id=update.message.chat_id, action='typing')
         msg = update.message.text
-        output = self.ai_manager.ask(update.effective_user.username, msg)
+        streamer = ReplyStreamer(c_message)
+        try:
+            output = await self.request_queue.submit(update.effective_user.username, msg, streamer)
+        except UserQueueFullError:
+            await c_message.edit_text(self.get_message(update, "busy"))
+            return
+        finally:
+            await streamer.close()
+        if output is None:
+            # merged with a following message, the answer is sent as reply to that one
+            await c_message.delete()
+            return
         response = output["response"]
-        await c_message.delete()
-        if "message_id" in output:
-            msg_id = output["message_id"]
+        if output.get("message_id"):
             try:
-                await update.message.reply_text(response, parse_mode=ParseMode.MARKDOWN, reply_to_message_id=msg_id)
+                await update.message.reply_text(response, parse_mode=ParseMode.MARKDOWN,
+                                                reply_to_message_id=output["message_id"])
+                await c_message.delete()
                 return
-            except:
+            except TelegramError:
                 pass
-        await update.message.reply_text(response, parse_mode=ParseMode.MARKDOWN, )
+        await self.edit_reply(c_message, response)
+
+    async def ask(self, user_id: str, msg: str, streamer: Optional[ReplyStreamer] = None):
+        on_update = streamer.push if streamer else None
+        if self.native_async:
+            return await self.ai_manager.aask(user_id, msg, on_update)
+        return await blocking.run_blocking(self.ai_manager.ask, user_id, msg, on_update)
+
+    @staticmethod
+    async def edit_reply(message: Message, text: str):
+        try:
+            await message.edit_text(text, parse_mode=ParseMode.MARKDOWN)
+        except BadRequest as e:
+            if "not modified" in str(e):
+                return
+            # the streamed text may be identical or not valid markdown
+            try:
+                await message.edit_text(text)
+            except BadRequest as e:
+                if "not modified" not in str(e):
+                    raise
 
     async def features(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         keyboard = [
@@ -120,7 +201,7 @@ class TelDocBot:
 
     async def commands(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         user_id = update.effective_user.username
-        features_commands = self.ai_manager.get_available_feature_commands(user_id)
+        features_commands = await blocking.run_blocking(self.ai_manager.get_available_feature_commands, user_id)
         print("Features")
         print(features_commands)
         keyboard = []
@@ -144,7 +225,7 @@ class TelDocBot:
     async def disable(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         query = update.callback_query
         await query.answer()
-        features = self.ai_manager.get_features_status(update.effective_user.username)
+        features = await blocking.run_blocking(self.ai_manager.get_features_status, update.effective_user.username)
         keyboard = []
         for feature_name, enabled in features.items():
             if enabled:
@@ -167,7 +248,7 @@ class TelDocBot:
         await query.edit_message_text(
             f"Calling...",
         )
-        self.ai_manager.call_feature_command(user_id, feature, cmd_name)
+        await blocking.run_blocking(self.ai_manager.call_feature_command, user_id, feature, cmd_name)
         await query.edit_message_text(
             f"Call completed",
         )
@@ -178,7 +259,7 @@ class TelDocBot:
         await query.answer()
         feature = query.data
         user_id = update.effective_user.username
-        self.ai_manager.disable_feature(user_id, feature)
+        await blocking.run_blocking(self.ai_manager.disable_feature, user_id, feature)
         await query.edit_message_text(
             f"Feature {feature} disabled.",
         )
@@ -187,7 +268,7 @@ class TelDocBot:
     async def configure(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         query = update.callback_query
         await query.answer()
-        features = self.ai_manager.get_features(update.effective_user.username)
+        features = await blocking.run_blocking(self.ai_manager.get_features, update.effective_user.username)
         keyboard = []
         for feature in features:
             keyboard.append([InlineKeyboardButton(feature,
@@ -203,9 +284,9 @@ class TelDocBot:
         await query.answer()
         feature = query.data
         user_id = update.effective_user.username
-        parameters = self.ai_manager.get_feature_parameters(user_id, feature)
+        parameters = await blocking.run_blocking(self.ai_manager.get_feature_parameters, user_id, feature)
         if len(parameters) == 0:
-            self.enable_feature(user_id, feature, dict())
+            await self.enable_feature(user_id, feature, dict())
             await query.edit_message_text(
                 "No parameters required, {} tool enabled.".format(feature),
             )
@@ -226,7 +307,7 @@ class TelDocBot:
         feature = context.user_data["feature"]
         key = context.user_data['current_parameter']
         context.user_data["available_parameters"][key] = text
-        parameters = self.ai_manager.get_feature_parameters(user_id, feature)
+        parameters = await blocking.run_blocking(self.ai_manager.get_feature_parameters, user_id, feature)
         for k, v in parameters.items():
             if k not in context.user_data["available_parameters"]:
                 context.user_data['current_parameter'] = k
@@ -235,21 +316,21 @@ class TelDocBot:
                     f"Please type {description}:",
                 )
                 return SETTING
-        self.enable_feature(user_id, feature, context.user_data["available_parameters"])
+        await self.enable_feature(user_id, feature, context.user_data["available_parameters"])
         await update.message.reply_text("Configuration completed, {} feature enabled.".format(feature))
         del context.user_data["feature"]
         del context.user_data['current_parameter']
         del context.user_data["available_parameters"]
         return ConversationHandler.END
 
-    def enable_feature(self, user_id: str, feature: str, values: Dict[str, str]):
-        self.ai_manager.enable_feature(user_id, feature, values)
+    async def enable_feature(self, user_id: str, feature: str, values: Dict[str, str]):
+        await blocking.run_blocking(self.ai_manager.enable_feature, user_id, feature, values)
 
     async def status(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         query = update.callback_query
         await query.answer()
         user_id = update.effective_user.username
-        features_status = self.ai_manager.get_features_status(user_id)
+        features_status = await blocking.run_blocking(self.ai_manager.get_features_status, user_id)
         msg = "\n".join("- {} tool is {}".format(f_name, "enabled" if f_status is True else "disabled")
                         for f_name, f_status in features_status.items())
         await query.edit_message_text(msg)
@@ -265,7 +346,7 @@ class TelDocBot:
 
     def get_message(self, update: Update, key: str, **kwargs):
         loc = self.get_locale(update)
-        lang = gettext.translation('tel_doc_bot', localedir='locales', languages=[loc])
+        lang = gettext.translation('tel_doc_bot', localedir=locales_path, languages=[loc])
         lang.install()
         return lang.gettext(key).format(**kwargs)
 
@@ -286,4 +367,4 @@ def load_config(config_file):
 if __name__ == '__main__':
     config_data = load_config(config_file_path)
     print("Configuration loaded successfully")
-    TelDocBot(config_data)
+    TelDocBot(config_data).run()
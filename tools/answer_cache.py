@@ -0,0 +1,82 @@
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+import blocking
+from metrics.registry import registry
+from tools.intent_handler import IntentHandler
+from vectorstore.similarity import cosine
+
+
+class AnswerCache(IntentHandler):
+    """
+    Returns the previous answer of a question with a close embedding, without running the agent.
+    Answers are stored only when the turn used read-only tools over the documents and are tagged
+    with the collection version, a new document makes them stale.
+    """
+    # tools reading data covered by the collection version, any other tool makes the answer not cacheable
+    READ_ONLY_TOOLS = {"document-extractor"}
+    _threshold: float = 0.95
+    _ttl: int = 86400  # seconds
+    _max_entries: int = 100
+
+    def __init__(self, embeddings: Embeddings, get_version: Callable[[], int],
+                 threshold: Optional[float] = None, ttl: Optional[int] = None, max_entries: Optional[int] = None):
+        self.embeddings = embeddings
+        self.get_version = get_version
+        self.threshold = threshold or self._threshold
+        self.ttl = ttl or self._ttl
+        self.max_entries = max_entries or self._max_entries
+        # (expiration, collection version, query embedding, output)
+        self.entries: List[Tuple[float, int, List[float], Dict[str, Any]]] = []
+        # embedding and version of the questions sent to the agent, used when the answer comes back
+        self.pending: Dict[str, Tuple[int, List[float]]] = dict()
+        self.lock = threading.Lock()
+
+    def handle(self, query: str) -> Optional[Dict[str, Any]]:
+        try:
+            version = self.get_version()
+            vector = self.embeddings.embed_query(query)
+        except Exception as e:
+            print("Answer cache lookup failed: {}".format(e))
+            return None
+        return self._lookup(query, version, vector)
+
+    async def ahandle(self, query: str) -> Optional[Dict[str, Any]]:
+        try:
+            version = await blocking.run_blocking(self.get_version)
+            vector = await self.embeddings.aembed_query(query)
+        except Exception as e:
+            print("Answer cache lookup failed: {}".format(e))
+            return None
+        return self._lookup(query, version, vector)
+
+    def on_response(self, query: str, output: Dict[str, Any]):
+        with self.lock:
+            pending = self.pending.pop(query, None)
+        tools = output.get("tools")
+        # partial answers have no tools, answers without tools depend on the conversation only
+        if pending is None or not tools or not set(tools) <= self.READ_ONLY_TOOLS:
+            return
+        version, vector = pending
+        with self.lock:
+            self.entries.append((time.monotonic() + self.ttl, version, vector,
+                                 dict(response=output["response"], message_id=output.get("message_id"))))
+            del self.entries[:-self.max_entries]
+
+    def _lookup(self, query: str, version: int, vector: List[float]) -> Optional[Dict[str, Any]]:
+        now = time.monotonic()
+        with self.lock:
+            self.entries = [e for e in self.entries if e[0] > now and e[1] == version]
+            scored = [(cosine(vector, e[2]), e[3]) for e in self.entries]
+            score, output = max(scored, key=lambda s: s[0], default=(0.0, None))
+            if score < self.threshold:
+                if len(self.pending) >= self.max_entries:
+                    # left by turns that failed before answering
+                    self.pending.clear()
+                self.pending[query] = (version, vector)
+                output = None
+        registry.inc("answer_cache_requests_total", result="hit" if output else "miss")
+        return dict(output) if output else None
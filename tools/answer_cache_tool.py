@@ -0,0 +1,36 @@
+from typing import List, Dict
+from langchain.tools import Tool
+import resources
+from tools.answer_cache import AnswerCache
+from tools.tool_instance import ToolInstance
+from vectorstore.vector_store_wrapper import VectorStoreWrapper
+
+
+class AnswerCacheTool(ToolInstance):
+    """ no tools for the agent, it answers the repeated questions on the documents from a cache """
+    _answer_cache: AnswerCache
+
+    @classmethod
+    def init(cls, **kwargs):
+        embeddings = resources.get_embeddings(kwargs["openai_api_key"])
+        collection = resources.get_vectorstore(VectorStoreWrapper.db_path, kwargs["user_id"], embeddings)
+        answer_cache = AnswerCache(embeddings, lambda: VectorStoreWrapper.get_collection_version(collection))
+        return cls(
+            _answer_cache=answer_cache,
+            **kwargs)
+
+    def get_tools(self, **kwargs) -> List[Tool]:
+        return []
+
+    def get_intent_handler(self) -> AnswerCache:
+        return self._answer_cache
+
+    @classmethod
+    def get_available_functions(cls) -> Dict[str, str]:
+        return dict(
+            clear_cache="Forget the cached answers"
+        )
+
+    def clear_cache(self):
+        with self._answer_cache.lock:
+            self._answer_cache.entries.clear()
@@ -2,6 +2,8 @@ from pydantic.v1 import Field
 from typing import List, Dict
 from langchain.chat_models.base import BaseChatModel
 from langchain.tools import Tool
+from ha.ha_handler import HAHandler
+from ha.intents import HAIntentHandler
 from ha_agent.query import HAAgentQuery
 from ha_agent.ai_tool import HAAgentAITool
 from tools.tool_instance import ToolInstance
@@ -11,13 +13,16 @@ class HAAgentTool(ToolInstance):
     url: str = Field(description="Home Assistant URL")
     bearer_token: str = Field(description="The bearer token to authenticate on Home Assistant")
     _ha_agent_query: HAAgentQuery
+    _intent_handler: HAIntentHandler
 
 
     @classmethod
     def init(cls, **kwargs):
         ha_agent_query = HAAgentQuery(**kwargs)
+        intent_handler = HAIntentHandler(HAHandler(**kwargs))
         return cls(
             _ha_agent_query=ha_agent_query,
+            _intent_handler=intent_handler,
             **kwargs)
 
     def get_tools(self, llm: BaseChatModel, **kwargs) -> List[Tool]:
@@ -25,6 +30,9 @@ class HAAgentTool(ToolInstance):
             HAAgentAITool(metadata=dict(ha_agent_query=self._ha_agent_query))
         ]
 
+    def get_intent_handler(self) -> HAIntentHandler:
+        return self._intent_handler
+
     @classmethod
     def get_available_functions(cls) -> Dict[str, str]:
         return dict()
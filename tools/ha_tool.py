@@ -6,6 +6,7 @@ from ha.entities_store_wrapper import EntitiesStoreWrapper
 from ha.ha_handler import HAHandler
 from ha.ha_action_tool import HaActionTool
 from ha.ha_status_tool import HAStatusTool
+from ha.intents import HAIntentHandler
 from tools.tool_instance import ToolInstance
 
 
@@ -15,6 +16,7 @@ class HATool(ToolInstance):
     # private vars
     _ha_db: EntitiesStoreWrapper
     _ha_handler: HAHandler
+    _intent_handler: HAIntentHandler
 
     @classmethod
     def init(cls, **kwargs):
@@ -23,6 +25,7 @@ class HATool(ToolInstance):
         return cls(
             _ha_db=ha_db,
             _ha_handler=ha_handler,
+            _intent_handler=HAIntentHandler(ha_handler),
             **kwargs)
 
     def get_tools(self, llm: BaseChatModel, **kwargs) -> List[Tool]:
@@ -32,6 +35,9 @@ class HATool(ToolInstance):
             HaActionTool(metadata=dict(ha_handler=self._ha_handler))
         ]
 
+    def get_intent_handler(self) -> HAIntentHandler:
+        return self._intent_handler
+
     @classmethod
     def get_available_functions(cls) -> Dict[str, str]:
         return dict(
@@ -0,0 +1,20 @@
+from typing import Any, Dict, Optional
+
+import blocking
+
+
+class IntentHandler:
+    """
+    Answers requests without running the agent, handle/ahandle return None to let the agent answer.
+    The output has the same format of the agent one: dict(response=..., message_id=...)
+    """
+
+    def handle(self, query: str) -> Optional[Dict[str, Any]]:
+        return None
+
+    async def ahandle(self, query: str) -> Optional[Dict[str, Any]]:
+        # handlers without a native async implementation block, they run on the bounded worker pool
+        return await blocking.run_blocking(self.handle, query)
+
+    def on_response(self, query: str, output: Dict[str, Any]):
+        """ called with the agent output of the requests not handled """
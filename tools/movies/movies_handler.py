@@ -1,7 +1,10 @@
+import httpx
 import requests
 from typing import List
 from langchain.schema import Document
 import json
+import resources
+from metrics.registry import registry
 
 
 class MoviesHandler:
@@ -43,8 +46,30 @@ class MoviesHandler:
     def watch(self, movie_id: str) -> bool:
         # e.g. https://ha.raelix.com/api/webhook/my-webhook-id
         url = f"{self.webhook_url}?id={movie_id}"
-        response = requests.get(url)
+        try:
+            with registry.timer("http_request_seconds", integration="netflix_webhook"):
+                response = requests.get(url, timeout=resources.get_http_timeout())
+        except requests.exceptions.RequestException as e:
+            print(f"An error occurred during the request: {e}")
+            registry.inc("http_errors_total", integration="netflix_webhook")
+            return False
+        if response.status_code != 200:
+            print(f"Request failed with status code: {response.status_code}")
+            registry.inc("http_errors_total", integration="netflix_webhook")
+            return False
+        return True
+
+    async def awatch(self, movie_id: str) -> bool:
+        url = f"{self.webhook_url}?id={movie_id}"
+        try:
+            with registry.timer("http_request_seconds", integration="netflix_webhook"):
+                response = await resources.get_async_http_client().get(url)
+        except httpx.HTTPError as e:
+            print(f"An error occurred during the request: {e}")
+            registry.inc("http_errors_total", integration="netflix_webhook")
+            return False
         if response.status_code != 200:
             print(f"Request failed with status code: {response.status_code}")
+            registry.inc("http_errors_total", integration="netflix_webhook")
             return False
         return True
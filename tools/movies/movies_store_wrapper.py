@@ -1,14 +1,12 @@
 from typing import List
-from langchain_openai import OpenAIEmbeddings
 from langchain.prompts import PromptTemplate
 from langchain.schema import Document
 from langchain.tools import Tool
-from langchain_community.vectorstores import Chroma
 from langchain.agents.agent_toolkits import create_retriever_tool
 import logging
 from langchain.retrievers.multi_query import MultiQueryRetriever
 from tools.movies.movies_handler import MoviesHandler
-import utils
+import resources
 
 
 def _set_logger():
@@ -28,14 +26,14 @@ class MoviesStoreWrapper:
         _set_logger()
         self.openai_api_key = openai_api_key
         self.user_id = user_id
-        self.embeddings = OpenAIEmbeddings(openai_api_key=self.openai_api_key, model=utils.EMBEDDINGS_MODEL)
+        self.embeddings = resources.get_embeddings(self.openai_api_key)
         self.movies_handler = movies_handler
         self._init_db()
 
     def _init_db(self):
-        self.db = Chroma(persist_directory=self.db_path,
-                         embedding_function=self.embeddings,
-                         collection_name="movies_{}".format(self.user_id))
+        self.db = resources.get_vectorstore(self.db_path,
+                                            "movies_{}".format(self.user_id),
+                                            self.embeddings)
 
     def add_document(self, documents: List[Document]):
         self.db.add_documents(documents)
@@ -21,5 +21,6 @@ class NetflixPlayerTool(BaseTool):
         movies_handler: MoviesHandler = self.metadata["movies_handler"]
         return movies_handler.watch(movie_id=movie_id)
 
-    def _arun(self, entity_id: str, entity_type: str, action: str):
-        raise NotImplementedError("netflix_player does not support async")
+    async def _arun(self, movie_id: str):
+        movies_handler: MoviesHandler = self.metadata["movies_handler"]
+        return await movies_handler.awatch(movie_id=movie_id)
@@ -4,10 +4,17 @@ from langchain_core.tools import BaseTool
 from pydantic.v1 import BaseModel, Field
 from langchain_community.document_loaders import AsyncHtmlLoader
 import re
+from metrics.registry import registry
 from tools.tool_instance import ToolInstance
 from langchain_community.tools import DuckDuckGoSearchRun
 
-from vectorstore.utils import generic
+from vectorstore.utils import generic, ageneric
+
+_SYSTEM_TEXT = ("You are a very powerful AI assistant"
+                "you are able to extract the netflix id of a movie from a list of urls."
+                "The id is generally after title/ path in the url."
+                "Return only the id you found without any other text or just say that it's not "
+                "available. Do not invent.")
 
 
 class NetflixIdDiscoveryCustomTool(ToolInstance):
@@ -41,20 +48,27 @@ class NetflixIdDiscoveryTool(BaseTool):
 
     def _run(self, movie_name: str):
         openai_api_key: str = self.metadata["openai_api_key"]
-        urls = [f"https://www.google.com/search?q={movie_name}+on+netflix"]
+        urls = [self.get_search_url(movie_name)]
         loader = AsyncHtmlLoader(urls)
-        docs = loader.load()
+        with registry.timer("http_request_seconds", integration="google_search"):
+            docs = loader.load()
         urls = self.extract_urls(docs[0].page_content)
         urls_text = ','.join(urls)
-        return generic(openai_api_key, "You are a very powerful AI assistant"
-                                       "you are able to extract the netflix id of a movie from a list of urls."
-                                       "The id is generally after title/ path in the url."
-                                       "Return only the id you found without any other text or just say that it's not "
-                                       "available. Do not invent.",
-                       urls_text)[0]
-
-    def _arun(self, movie_name: str):
-        raise NotImplementedError("netflix_id_discovery does not support async")
+        return generic(openai_api_key, _SYSTEM_TEXT, urls_text)[0]
+
+    async def _arun(self, movie_name: str):
+        openai_api_key: str = self.metadata["openai_api_key"]
+        urls = [self.get_search_url(movie_name)]
+        loader = AsyncHtmlLoader(urls)
+        with registry.timer("http_request_seconds", integration="google_search"):
+            pages = await loader.fetch_all(urls)
+        urls = self.extract_urls(pages[0])
+        urls_text = ','.join(urls)
+        return (await ageneric(openai_api_key, _SYSTEM_TEXT, urls_text))[0]
+
+    @staticmethod
+    def get_search_url(movie_name: str):
+        return f"https://www.google.com/search?q={movie_name}+on+netflix"
 
     def extract_urls(self, text):
         url_pattern = r'https?://\S+'
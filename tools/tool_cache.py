@@ -0,0 +1,142 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from langchain_core.tools import BaseTool
+
+from metrics.callbacks import current_turn
+from metrics.registry import registry
+
+
+class ToolResultCache:
+    """
+    TTL cache for the results of idempotent tools, keyed by tool name and normalized arguments.
+    Only the tools listed in the policies are cached, side-effecting tools must never be added there.
+    """
+    _max_size: int = 1000
+    # tool name -> (ttl in seconds, result shared across users)
+    POLICIES: Dict[str, Tuple[int, bool]] = dict(
+        duckduckgo_search=(600, True),
+        GoogleSearch=(600, True),
+        netflix_id_discovery=(86400, True),
+        home_assistant_status=(10, False),
+    )
+    NON_CACHEABLE = {"home_assistant_action", "home_assistant_agent", "netflix_player"}
+    # results of failed calls (e.g. "Error while connecting..." or the empty search answers) are never replayed
+    ERROR_PREFIXES = ("error", "no good ")
+
+    def __init__(self, policies: Optional[Dict[str, Tuple[int, bool]]] = None, max_size: Optional[int] = None):
+        self.policies = policies if policies is not None else self.POLICIES
+        self.max_size = max_size or self._max_size
+        self.entries: OrderedDict[str, Tuple[float, Any]] = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits: Dict[str, int] = dict()
+        self.misses: Dict[str, int] = dict()
+
+    def is_cacheable(self, tool_name: str) -> bool:
+        return tool_name in self.policies and tool_name not in self.NON_CACHEABLE
+
+    def wrap(self, tool: BaseTool, user_id: str) -> BaseTool:
+        if not self.is_cacheable(tool.name):
+            return tool
+        return CachedTool(name=tool.name,
+                          description=tool.description,
+                          args_schema=tool.args_schema,
+                          tool=tool,
+                          user_id=user_id,
+                          cache=self)
+
+    def get_key(self, tool_name: str, user_id: str, tool_input: Any) -> str:
+        _, shared = self.policies[tool_name]
+        scope = "*" if shared else user_id
+        return "{}|{}|{}".format(tool_name, scope, json.dumps(_normalize(tool_input), sort_keys=True))
+
+    def get(self, tool_name: str, key: str) -> Tuple[bool, Any]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits[tool_name] = self.hits.get(tool_name, 0) + 1
+                found, value = True, entry[1]
+            else:
+                if entry is not None:
+                    del self.entries[key]
+                self.misses[tool_name] = self.misses.get(tool_name, 0) + 1
+                found, value = False, None
+        registry.inc("tool_cache_requests_total", tool=tool_name, result="hit" if found else "miss")
+        turn = current_turn.get()
+        if found and turn is not None:
+            turn.cache_hits += 1
+        return found, value
+
+    def is_error(self, value: Any) -> bool:
+        if value is None or isinstance(value, Exception):
+            return True
+        return isinstance(value, str) and (not value.strip() or value.lstrip().lower().startswith(self.ERROR_PREFIXES))
+
+    def set(self, tool_name: str, key: str, value: Any):
+        if self.is_error(value):
+            registry.inc("tool_cache_skipped_total", tool=tool_name)
+            return
+        ttl, _ = self.policies[tool_name]
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return dict(
+                size=len(self.entries),
+                hits=sum(self.hits.values()),
+                misses=sum(self.misses.values()),
+                tools={name: dict(hits=self.hits.get(name, 0), misses=self.misses.get(name, 0))
+                       for name in set(self.hits) | set(self.misses)},
+            )
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, str):
+        return " ".join(value.lower().split())
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+class CachedTool(BaseTool):
+    """
+    exposes the same schema of the wrapped tool and serves repeated calls from the cache,
+    failed calls (raised or returning an error message) are not cached
+    """
+    tool: Any
+    user_id: str
+    cache: Any
+
+    def _run(self, *args, **kwargs):
+        tool_input = kwargs if kwargs else (args[0] if len(args) == 1 else list(args))
+        key = self.cache.get_key(self.name, self.user_id, tool_input)
+        found, value = self.cache.get(self.name, key)
+        if found:
+            return value
+        value = self.tool.invoke(tool_input)
+        self.cache.set(self.name, key, value)
+        return value
+
+    async def _arun(self, *args, **kwargs):
+        tool_input = kwargs if kwargs else (args[0] if len(args) == 1 else list(args))
+        key = self.cache.get_key(self.name, self.user_id, tool_input)
+        found, value = self.cache.get(self.name, key)
+        if found:
+            return value
+        value = await self.tool.ainvoke(tool_input)
+        self.cache.set(self.name, key, value)
+        return value
+
+
+# shared by all the users, web searches and netflix lookups are not user specific
+tool_result_cache = ToolResultCache()
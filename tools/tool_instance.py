@@ -1,8 +1,9 @@
 import abc
 from pydantic.v1 import Field, BaseModel, Extra
-from typing import List, Dict
+from typing import List, Dict, Optional
 from langchain.tools import Tool
 from abc import abstractmethod
+from tools.intent_handler import IntentHandler
 
 
 class ToolInstance(BaseModel, abc.ABC):
@@ -26,6 +27,10 @@ class ToolInstance(BaseModel, abc.ABC):
     def get_available_functions(cls) -> Dict[str, str]:
         """ return the exposed functions [function name, function description]"""
 
+    def get_intent_handler(self) -> Optional[IntentHandler]:
+        """ return the handler answering simple requests without the agent, if any """
+        return None
+
     @classmethod
     def get_required_fields(cls, alias=False):
         return cls.schema(alias).get("properties")
@@ -1,12 +1,15 @@
-from typing import List, Dict, Type
+from typing import List, Dict, Type, Optional
 from langchain.tools import Tool
 from settings.user_settings import UserSettings
+from tools.answer_cache_tool import AnswerCacheTool
 from tools.duckduckgo_tool import DuckDuckGoTool
 from tools.googlesearch_tool import GoogleSearchTool
 # from tools.ha_tool import HATool
 from tools.ha_agent_tool import HAAgentTool
 from tools.movies_tool import MoviesTool
 from tools.netflix_id_scraper_tool import NetflixIdDiscoveryCustomTool
+from tools.intent_handler import IntentHandler
+from tools.tool_cache import tool_result_cache
 from tools.tool_instance import ToolInstance
 
 
@@ -17,43 +20,63 @@ class ToolsManager:
         self.user_id = user_id
         self.user_settings = user_settings
         self.instances: Dict[str, ToolInstance] = dict()
+        # tools and parameters of the loaded instances, used to rebuild only what changed
+        self.tools: Dict[str, List[Tool]] = dict()
+        self.parameters: Dict[str, Dict[str, str]] = dict()
         self.classes: Dict[str, Type[ToolInstance]] = dict(
             # home_assistant=HATool,
             home_assistant_ai=HAAgentTool,
             duckduckgo=DuckDuckGoTool,
             googlesearch=GoogleSearchTool,
             movies_tool=MoviesTool,
-            netflix_id_scraper=NetflixIdDiscoveryCustomTool
+            netflix_id_scraper=NetflixIdDiscoveryCustomTool,
+            answer_cache=AnswerCacheTool,
         )
 
     def get_user_tools(self, **kwargs) -> List[Tool]:
-        self.instances = dict()
         tools: List[Tool] = []
         for tool_name, tool_type in self.classes.items():
-            if self.user_settings.is_tool_enabled(tool_name):
-                args = dict()
-                missing_parameter = False
-                for param in tool_type.get_required_fields().keys():
-                    if param == "openai_api_key":
-                        args[param] = self.openai_api_key
-                    elif param == "user_id":
-                        args[param] = self.user_id
-                    else:
-                        param_value = self.user_settings.get_tool_parameter(param)
-                        if param_value:
-                            args[param] = param_value
-                        else:
-                            missing_parameter = True
-                            print("Cannot instantiate {} tool due to missing {} property".format(tool_name, param))
-                            break
-                if missing_parameter:
-                    print("Skipping {} tool".format(tool_name))
-                    continue
+            args = self._get_tool_args(tool_name, tool_type) if self.user_settings.is_tool_enabled(tool_name) else None
+            if args is None:
+                self._drop_tool(tool_name)
+                continue
+            if tool_name not in self.instances or self.parameters[tool_name] != args:
+                self._drop_tool(tool_name)
                 self.instances[tool_name] = tool_type.init(**args)
-                tools += self.instances[tool_name].get_tools(**kwargs)
+                self.parameters[tool_name] = args
                 print("Tool: {} loaded successfully".format(tool_name))
+            if tool_name not in self.tools:
+                self.tools[tool_name] = [tool_result_cache.wrap(tool, self.user_id)
+                                         for tool in self.instances[tool_name].get_tools(**kwargs)]
+            tools += self.tools[tool_name]
         return tools
 
+    def get_intent_handlers(self) -> List[IntentHandler]:
+        handlers = [instance.get_intent_handler() for instance in list(self.instances.values())]
+        return [handler for handler in handlers if handler is not None]
+
+    def _get_tool_args(self, tool_name: str, tool_type: Type[ToolInstance]) -> Optional[Dict[str, str]]:
+        args = dict()
+        for param in tool_type.get_required_fields().keys():
+            if param == "openai_api_key":
+                args[param] = self.openai_api_key
+            elif param == "user_id":
+                args[param] = self.user_id
+            else:
+                param_value = self.user_settings.get_tool_parameter(param)
+                if param_value:
+                    args[param] = param_value
+                else:
+                    print("Cannot instantiate {} tool due to missing {} property".format(tool_name, param))
+                    print("Skipping {} tool".format(tool_name))
+                    return None
+        return args
+
+    def _drop_tool(self, tool_name: str):
+        self.instances.pop(tool_name, None)
+        self.tools.pop(tool_name, None)
+        self.parameters.pop(tool_name, None)
+
     def get_tools_list(self):
         return self.classes.keys()
 
@@ -81,6 +104,8 @@ class ToolsManager:
         if tool_name in self.instances:
             method = getattr(self.instances[tool_name], function_name)
             method()
+            # the function may have replaced the handles used by the tools, they are rebuilt on the next load
+            self.tools.pop(tool_name, None)
         else:
             print("function {} is not available on {} tool".format(function_name, tool_name))
 
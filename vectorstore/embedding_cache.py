@@ -0,0 +1,138 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+from langchain_core.embeddings import Embeddings
+
+import blocking
+from metrics.registry import registry
+from vectorstore.sqlite_pool import chunks, get_connection, placeholders
+
+
+def _hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Content addressed embeddings shared by all the vector stores: the key is (model, sha256 of the text)
+    and vectors are stored as float32 blobs, half the size of the JSON/float64 representations.
+    """
+    _db_file_name: str = "embeddings.sqlite3"
+
+    def __init__(self, db_path: str):
+        self.path = os.path.join(db_path, self._db_file_name)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        with self._get_connection() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS embeddings ("
+                               "model TEXT NOT NULL, hash TEXT NOT NULL, vector BLOB NOT NULL, "
+                               "PRIMARY KEY (model, hash)) WITHOUT ROWID")
+
+    def _get_connection(self) -> sqlite3.Connection:
+        return get_connection(self.path)
+
+    def mget(self, model: str, hashes: Sequence[str]) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = dict()
+        connection = self._get_connection()
+        for chunk in chunks(list(dict.fromkeys(hashes))):
+            rows = connection.execute("SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({})"
+                                      .format(placeholders(len(chunk))), [model] + chunk).fetchall()
+            for key, blob in rows:
+                found[key] = array("f", blob).tolist()
+        with self.lock:
+            self.hits += sum(1 for h in hashes if h in found)
+            self.misses += sum(1 for h in hashes if h not in found)
+        return found
+
+    def mset(self, model: str, vectors: Dict[str, List[float]]):
+        try:
+            with self._get_connection() as connection:
+                connection.executemany("INSERT OR REPLACE INTO embeddings (model, hash, vector) VALUES (?, ?, ?)",
+                                       [(model, key, array("f", vector).tobytes()) for key, vector in vectors.items()])
+        except sqlite3.Error as e:
+            # the embeddings are still returned, they are just computed again next time
+            print("Embedding cache write failed: {}".format(e))
+
+    def get_stats(self) -> Dict[str, float]:
+        with self.lock:
+            total = self.hits + self.misses
+            return dict(hits=self.hits, misses=self.misses, hit_ratio=self.hits / total if total else 0.0)
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    serves the texts already embedded by the model from the cache, only the new ones reach the wrapped model.
+    Queries are not stored: they are rarely repeated, only the last ones are kept in memory
+    (the tool selection and the answer cache embed the same question)
+    """
+    _max_queries: int = 256
+
+    def __init__(self, embeddings: Embeddings, model: str, cache: EmbeddingCache):
+        self.embeddings = embeddings
+        self.model = model
+        self.cache = cache
+        self.queries: OrderedDict[str, List[float]] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _get_query(self, text: str) -> Optional[List[float]]:
+        with self.lock:
+            vector = self.queries.get(text)
+            if vector is not None:
+                self.queries.move_to_end(text)
+        registry.inc("embedding_cache_requests_total", model=self.model,
+                     result="query_hit" if vector is not None else "query_miss")
+        return vector
+
+    def _set_query(self, text: str, vector: List[float]) -> List[float]:
+        with self.lock:
+            self.queries[text] = vector
+            self.queries.move_to_end(text)
+            while len(self.queries) > self._max_queries:
+                self.queries.popitem(last=False)
+        return vector
+
+    def _lookup(self, texts: List[str]):
+        hashes = [_hash(t) for t in texts]
+        found = self.cache.mget(self.model, hashes)
+        # duplicated texts are embedded once
+        missing = dict()
+        misses = 0
+        for text, key in zip(texts, hashes):
+            if key not in found:
+                missing.setdefault(key, text)
+                misses += 1
+        registry.inc("embedding_cache_requests_total", len(texts) - misses, model=self.model, result="hit")
+        registry.inc("embedding_cache_requests_total", misses, model=self.model, result="miss")
+        return hashes, found, missing
+
+    def _merge(self, hashes: List[str], found: Dict[str, List[float]], missing: Dict[str, str],
+               vectors: Optional[List[List[float]]]) -> List[List[float]]:
+        if missing:
+            computed = dict(zip(missing.keys(), vectors))
+            self.cache.mset(self.model, computed)
+            found.update(computed)
+        return [found[h] for h in hashes]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes, found, missing = self._lookup(texts)
+        vectors = self.embeddings.embed_documents(list(missing.values())) if missing else None
+        return self._merge(hashes, found, missing, vectors)
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = self._get_query(text)
+        return vector if vector is not None else self._set_query(text, self.embeddings.embed_query(text))
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes, found, missing = await blocking.run_blocking(self._lookup, texts)
+        vectors = await self.embeddings.aembed_documents(list(missing.values())) if missing else None
+        return await blocking.run_blocking(self._merge, hashes, found, missing, vectors)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        vector = self._get_query(text)
+        return vector if vector is not None else self._set_query(text, await self.embeddings.aembed_query(text))
@@ -0,0 +1,174 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Tuple
+
+from langchain.output_parsers.openai_functions import JsonOutputFunctionsParser
+from langchain.prompts import ChatPromptTemplate
+from langchain.text_splitter import RecursiveCharacterTextSplitter, TextSplitter
+from langchain.schema import Document
+from langchain.schema.runnable import Runnable, RunnableLambda
+from langchain_core.stores import BaseStore
+from langchain_core.vectorstores import VectorStore
+
+from metrics.registry import registry
+import resources
+import utils
+
+INDEX_CHUNK_FUNCTION = {
+    "name": "index_chunk",
+    "description": "Index a document chunk with its summary and the questions it could be used to answer",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "summary": {"type": "string"},
+            "questions": {
+                "type": "array",
+                "items": {"type": "string"},
+            },
+        },
+        "required": ["summary", "questions"],
+    },
+}
+_PROMPT = ("Summarize the following document and generate a list of 3 hypothetical questions "
+           "that the document could be used to answer:\n\n{doc}")
+
+# chunks in flight across all the uploads of the process, each one holds a LLM call or an embeddings request
+_max_concurrency: int = 8
+_max_attempts: int = 3
+# tokens of the parent chunks, they are sent to the generation prompt and returned to the agent
+_chunk_size: int = 500
+_chunk_overlap: int = 50
+_executor: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+
+
+def configure(max_concurrency: Optional[int] = None, chunk_size: Optional[int] = None,
+              chunk_overlap: Optional[int] = None):
+    global _max_concurrency, _chunk_size, _chunk_overlap, _executor
+    with _lock:
+        if max_concurrency and max_concurrency != _max_concurrency:
+            _max_concurrency = max_concurrency
+            _executor = None
+        _chunk_size = chunk_size or _chunk_size
+        _chunk_overlap = chunk_overlap if chunk_overlap is not None else _chunk_overlap
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=_max_concurrency, thread_name_prefix="ingestion")
+        return _executor
+
+
+class IngestionError(Exception):
+    """ some chunks of an upload failed, the chunks already written were removed """
+
+
+def index_chunk_chain(openai_api_key: str) -> Runnable:
+    """ summary and hypothetical questions of a chunk in a single structured call """
+    return (
+            {"doc": lambda x: x.page_content}
+            | ChatPromptTemplate.from_template(_PROMPT)
+            | resources.get_llm(openai_api_key, max_retries=0, temperature=0).bind(
+        functions=[INDEX_CHUNK_FUNCTION],
+        function_call={"name": INDEX_CHUNK_FUNCTION["name"]}
+    )
+            | JsonOutputFunctionsParser()
+    )
+
+
+def get_splitter() -> TextSplitter:
+    with _lock:
+        chunk_size, chunk_overlap = _chunk_size, _chunk_overlap
+    return RecursiveCharacterTextSplitter.from_tiktoken_encoder(model_name=utils.AGENT_MODEL,
+                                                                chunk_size=chunk_size,
+                                                                chunk_overlap=chunk_overlap)
+
+
+class IngestionPipeline:
+    """
+    Multi-vector ingestion: pages are split in token sized chunks with overlap, then every chunk goes
+    through generation, embedding and store writes on its own, so a slow chunk doesn't hold back the others.
+    The chunks of all the uploads share one pool. A chunk is retried as a whole (e.g. on 429), an upload
+    is indexed completely or not at all.
+    """
+
+    def __init__(self, openai_api_key: str, vectorstore: VectorStore, docstore: BaseStore[str, Document],
+                 id_key: str):
+        self.chain = index_chunk_chain(openai_api_key)
+        # the writes use ids derived from the doc_id, a retried chunk overwrites what its failed attempt wrote
+        self.index_chunk = RunnableLambda(self._index_chunk).with_retry(stop_after_attempt=_max_attempts,
+                                                                        wait_exponential_jitter=True)
+        # created on the first upload, the tokenizer files may be downloaded and fail there
+        self.splitter: Optional[TextSplitter] = None
+        self.vectorstore = vectorstore
+        self.docstore = docstore
+        self.id_key = id_key
+
+    def ingest(self, documents: List[Document], msg_id: int) -> List[str]:
+        chunks = self.split(documents)
+        doc_ids = [str(uuid.uuid4()) for _ in chunks]
+        # doc_id -> ids of the child vectors, filled before they are written so that they can be removed
+        written: Dict[str, List[str]] = dict()
+        executor = _get_executor()
+        futures = [executor.submit(self._process_chunk, doc, doc_id, msg_id, written)
+                   for doc, doc_id in zip(chunks, doc_ids)]
+        wait(futures)
+        errors = [f.exception() for f in futures if f.exception() is not None]
+        print("{} pages split in {} chunks, {} indexed, {} failed".format(len(documents), len(chunks),
+                                                                         len(futures) - len(errors), len(errors)))
+        if errors:
+            self._rollback(doc_ids, written)
+            raise IngestionError("{} of {} chunks failed: {}".format(len(errors), len(chunks), errors[0])) \
+                from errors[0]
+        return doc_ids
+
+    def split(self, documents: List[Document]) -> List[Document]:
+        if self.splitter is None:
+            self.splitter = get_splitter()
+        chunks = []
+        for doc in documents:
+            # the chunks keep the metadata of the page (e.g. source and page number) plus the page they come from
+            page_id = str(uuid.uuid4())
+            for i, chunk in enumerate(self.splitter.split_documents([doc])):
+                chunk.metadata.update(page_id=page_id, chunk=i)
+                chunks.append(chunk)
+        return chunks
+
+    def _process_chunk(self, doc: Document, doc_id: str, msg_id: int, written: Dict[str, List[str]]):
+        start = time.perf_counter()
+        try:
+            self.index_chunk.invoke(dict(doc=doc, doc_id=doc_id, msg_id=msg_id, written=written))
+        except Exception:
+            registry.inc("ingestion_chunks_total", result="error")
+            raise
+        registry.inc("ingestion_chunks_total", result="ok")
+        registry.observe("ingestion_chunk_seconds", time.perf_counter() - start)
+
+    def _index_chunk(self, inputs: Dict):
+        doc, doc_id, msg_id, written = inputs["doc"], inputs["doc_id"], inputs["msg_id"], inputs["written"]
+        summary, questions = self._generate(doc)
+        children = [Document(page_content=s, metadata={self.id_key: doc_id}) for s in questions + [summary] if s]
+        parent = Document(page_content=f"{doc.page_content}\n\nmessage_id: {msg_id}",
+                          metadata=dict(doc.metadata, message_id=msg_id))
+        # the parent is written first, a child vector never points to a missing parent
+        self.docstore.mset([(doc_id, parent)])
+        ids = ["{}-{}".format(doc_id, i) for i in range(len(children))]
+        written[doc_id] = sorted(set(written.get(doc_id, [])) | set(ids))
+        self.vectorstore.add_documents(children, ids=ids)
+
+    def _rollback(self, doc_ids: List[str], written: Dict[str, List[str]]):
+        try:
+            ids = [i for doc_id in doc_ids for i in written.get(doc_id, [])]
+            if ids:
+                self.vectorstore.delete(ids=ids)
+            self.docstore.mdelete(doc_ids)
+        except Exception as e:
+            print("Rollback of the failed upload failed: {}".format(e))
+
+    def _generate(self, doc: Document) -> Tuple[str, List[str]]:
+        output = self.chain.invoke(doc)
+        return output.get("summary") or "", [q for q in output.get("questions") or [] if q]
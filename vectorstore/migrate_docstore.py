@@ -0,0 +1,50 @@
+import argparse
+import glob
+import os
+import sqlite3
+from typing import List
+
+from vectorstore.sqlite_docstore import BACKENDS, create_docstore, get_docstore_file
+from vectorstore.vector_store_wrapper import VectorStoreWrapper
+
+_table_prefix: str = "docstore_"
+
+
+def get_user_ids(backend: str, store_path: str, db_path: str) -> List[str]:
+    if backend == "sharded":
+        files = glob.glob(os.path.join(store_path, "docstore", "*.sqlite3"))
+        return sorted(os.path.splitext(os.path.basename(f))[0] for f in files)
+    path = get_docstore_file(backend, store_path, db_path, "")
+    if not os.path.exists(path):
+        return []
+    with sqlite3.connect(path) as connection:
+        rows = connection.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE ? ESCAPE '\\'",
+                                  (_table_prefix.replace("_", "\\_") + "%",)).fetchall()
+    return sorted(name[len(_table_prefix):] for name, in rows)
+
+
+def migrate_user(source: str, target: str, store_path: str, db_path: str, user_id: str, drop: bool) -> int:
+    target_store = create_docstore(target, store_path, db_path, user_id, import_legacy=False)
+    # the source is read without opening a store on it, it is left untouched unless dropped
+    return target_store.import_table(get_docstore_file(source, store_path, db_path, user_id), drop)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Copy the documents of every user between docstore backends")
+    parser.add_argument("--source", choices=BACKENDS, default="chroma")
+    parser.add_argument("--target", choices=BACKENDS, default="dedicated")
+    parser.add_argument("--store-path", default=VectorStoreWrapper.store_path)
+    parser.add_argument("--db-path", default=VectorStoreWrapper.db_path)
+    parser.add_argument("--drop", action="store_true", help="drop the source tables once copied")
+    args = parser.parse_args()
+    if args.source == args.target:
+        parser.error("source and target backends must differ")
+    user_ids = get_user_ids(args.source, args.store_path, args.db_path)
+    for user_id in user_ids:
+        count = migrate_user(args.source, args.target, args.store_path, args.db_path, user_id, args.drop)
+        print("{}: {} documents copied".format(user_id, count))
+    print("Migrated {} users from {} to {}".format(len(user_ids), args.source, args.target))
+
+
+if __name__ == "__main__":
+    main()
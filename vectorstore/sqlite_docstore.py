@@ -0,0 +1,220 @@
+import json
+import os
+import sqlite3
+import struct
+import time
+import zlib
+from typing import Iterator, List, Optional, Sequence, Tuple, Union
+
+from langchain.schema import BaseStore
+
+from vectorstore.sqlite_pool import chunks, get_connection, placeholders
+
+BACKENDS = ("dedicated", "sharded", "chroma")
+DEFAULT_BACKEND = "dedicated"
+
+# record: magic, format version, codec, then the body
+_MAGIC = b"TDS"
+_VERSION = 1
+_HEADER = struct.Struct("3sBB")
+CODEC_RAW = 0
+CODEC_ZLIB = 1
+# format of the tables, tables below it are migrated once when opened
+TABLE_VERSION = 2
+# not prefixed by docstore_, it can't be taken for the table of a user
+_versions_table = "tel_doc_bot_docstore_versions"
+# tables already copied from another file, e.g. the legacy tables of the chroma database
+_imports_table = "tel_doc_bot_docstore_imports"
+_import_batch_size: int = 500
+# smaller documents don't shrink enough to pay for the decompression
+_min_compress_size: int = 256
+_compress_level: int = 6
+
+
+def encode_record(value: bytes) -> bytes:
+    codec = CODEC_RAW
+    body = value
+    if len(value) >= _min_compress_size:
+        compressed = zlib.compress(value, _compress_level)
+        if len(compressed) < len(value):
+            codec, body = CODEC_ZLIB, compressed
+    return _HEADER.pack(_MAGIC, _VERSION, codec) + body
+
+
+def decode_record(data: Union[str, bytes]) -> bytes:
+    # rows written before the binary format hold the document as JSON text
+    if isinstance(data, str):
+        return json.loads(data).encode("utf-8")
+    magic, version, codec = _HEADER.unpack_from(data)
+    if magic != _MAGIC or version != _VERSION:
+        raise ValueError("Unknown docstore record format")
+    body = data[_HEADER.size:]
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(body)
+    if codec == CODEC_RAW:
+        return bytes(body)
+    raise ValueError("Unknown docstore record codec {}".format(codec))
+
+
+def get_table_name(user_id: str) -> str:
+    return "docstore_{}".format(user_id)
+
+
+def get_docstore_file(backend: str, store_path: str, db_path: str, user_id: str) -> str:
+    """
+    dedicated: one file for all the users, out of the chroma database so the two don't share the write lock
+    sharded: one file per user, ingestion of a user never waits for the others
+    chroma: the legacy layout, the tables live in the chroma database file
+    """
+    if backend == "dedicated":
+        return os.path.join(store_path, "docstore.sqlite3")
+    if backend == "sharded":
+        return os.path.join(store_path, "docstore", "{}.sqlite3".format(user_id))
+    if backend == "chroma":
+        return os.path.join(db_path, "chroma.sqlite3")
+    raise ValueError("Unknown docstore backend {}, expected one of {}".format(backend, ", ".join(BACKENDS)))
+
+
+class SQLiteDocstore(BaseStore[str, bytes]):
+    """
+    Parent documents of the multi-vector retriever, one table per user.
+    The connection is kept open per thread, ids are the primary key and lookups are bound and chunked
+    below the sqlite variable limit. Documents are stored as versioned, compressed binary records.
+    """
+
+    def __init__(self, path: str, user_id: str, wal: bool = True):
+        self.path = path
+        self.table_name = get_table_name(user_id)
+        # the legacy chroma backend shares the file with chroma, its journal mode is left to chroma
+        self.wal = wal
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._create_table()
+
+    def get_connection(self) -> sqlite3.Connection:
+        return get_connection(self.path, self.wal)
+
+    def _create_table(self):
+        with self.get_connection() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS "{}" (table_name TEXT PRIMARY KEY, version INTEGER NOT NULL)'
+                               .format(_versions_table))
+            connection.execute('CREATE TABLE IF NOT EXISTS "{}" (table_name TEXT PRIMARY KEY, source TEXT NOT NULL, '
+                               'imported REAL NOT NULL)'.format(_imports_table))
+            row = connection.execute('SELECT version FROM "{}" WHERE table_name = ?'.format(_versions_table),
+                                     (self.table_name,)).fetchone()
+            if row and row[0] >= TABLE_VERSION:
+                # a table dropped after its migration is created again
+                connection.execute('CREATE TABLE IF NOT EXISTS "{}" (id TEXT PRIMARY KEY, data BLOB NOT NULL)'
+                                   .format(self.table_name))
+                return
+            columns = connection.execute('PRAGMA table_info("{}")'.format(self.table_name)).fetchall()
+            # (cid, name, type, notnull, default, pk), tables created before the id was a primary key are migrated
+            if columns and not any(column[5] for column in columns):
+                self._migrate_table(connection)
+            connection.execute('CREATE TABLE IF NOT EXISTS "{}" (id TEXT PRIMARY KEY, data BLOB NOT NULL)'
+                               .format(self.table_name))
+            if columns:
+                self._migrate_records(connection)
+            connection.execute('INSERT OR REPLACE INTO "{}" (table_name, version) VALUES (?, ?)'
+                               .format(_versions_table), (self.table_name, TABLE_VERSION))
+
+    def _migrate_table(self, connection: sqlite3.Connection):
+        migrated = "{}_migrated".format(self.table_name)
+        connection.execute('DROP TABLE IF EXISTS "{}"'.format(migrated))
+        connection.execute('CREATE TABLE "{}" (id TEXT PRIMARY KEY, data BLOB NOT NULL)'.format(migrated))
+        # the legacy table allowed duplicated ids, the last written row wins
+        connection.execute('INSERT OR REPLACE INTO "{}" (id, data) SELECT id, data FROM "{}" '
+                           'WHERE id IS NOT NULL AND data IS NOT NULL ORDER BY rowid'
+                           .format(migrated, self.table_name))
+        connection.execute('DROP TABLE "{}"'.format(self.table_name))
+        connection.execute('ALTER TABLE "{}" RENAME TO "{}"'.format(migrated, self.table_name))
+        print("Migrated {} to a primary key table".format(self.table_name))
+
+    def _migrate_records(self, connection: sqlite3.Connection):
+        rows = connection.execute('SELECT id, data FROM "{}" WHERE typeof(data) = \'text\''
+                                  .format(self.table_name)).fetchall()
+        if not rows:
+            return
+        connection.executemany('UPDATE "{}" SET data = ? WHERE id = ?'.format(self.table_name),
+                               [(encode_record(decode_record(data)), key) for key, data in rows])
+        print("Migrated {} records of {} to the binary format".format(len(rows), self.table_name))
+
+    def import_table(self, source_file: str, drop: bool = False) -> int:
+        """ copies the documents of the user from another docstore file, the source is opened read-only """
+        count = 0
+        uri = "file:{}?mode={}".format(source_file, "rw" if drop else "ro")
+        with sqlite3.connect(uri, uri=True) as source:
+            cursor = source.execute('SELECT id, data FROM "{}" WHERE id IS NOT NULL AND data IS NOT NULL '
+                                    'ORDER BY rowid'.format(self.table_name))
+            while True:
+                rows = cursor.fetchmany(_import_batch_size)
+                if not rows:
+                    break
+                # legacy rows are decoded and written again in the current format, the last written id wins
+                self.mset([(key, decode_record(data)) for key, data in rows])
+                count += len(rows)
+            if drop:
+                source.execute('DROP TABLE "{}"'.format(self.table_name))
+        self._set_imported(source_file)
+        return count
+
+    def import_legacy(self, source_file: str):
+        """ copies the table of the user from source_file the first time the store is opened """
+        if self.get_connection().execute('SELECT 1 FROM "{}" WHERE table_name = ?'.format(_imports_table),
+                                         (self.table_name,)).fetchone():
+            return
+        if os.path.exists(source_file) and self._has_table(source_file):
+            count = self.import_table(source_file)
+            print("Imported {} documents of {} from {}".format(count, self.table_name, source_file))
+        else:
+            self._set_imported(source_file)
+
+    def _set_imported(self, source_file: str):
+        with self.get_connection() as connection:
+            connection.execute('INSERT OR REPLACE INTO "{}" (table_name, source, imported) VALUES (?, ?, ?)'
+                               .format(_imports_table), (self.table_name, source_file, time.time()))
+
+    def _has_table(self, source_file: str) -> bool:
+        with sqlite3.connect("file:{}?mode=ro".format(source_file), uri=True) as source:
+            return source.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                                  (self.table_name,)).fetchone() is not None
+
+    def mget(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        found = dict()
+        connection = self.get_connection()
+        for chunk in chunks(list(dict.fromkeys(keys))):
+            rows = connection.execute('SELECT id, data FROM "{}" WHERE id IN ({})'
+                                      .format(self.table_name, placeholders(len(chunk))), chunk).fetchall()
+            for key, data in rows:
+                found[key] = decode_record(data)
+        return [found.get(key) for key in keys]
+
+    def mset(self, key_value_pairs: Sequence[Tuple[str, bytes]]) -> None:
+        with self.get_connection() as connection:
+            connection.executemany('INSERT OR REPLACE INTO "{}" (id, data) VALUES (?, ?)'.format(self.table_name),
+                                   [(key, encode_record(value)) for key, value in key_value_pairs])
+
+    def mdelete(self, keys: Sequence[str]) -> None:
+        with self.get_connection() as connection:
+            for chunk in chunks(list(keys)):
+                connection.execute('DELETE FROM "{}" WHERE id IN ({})'
+                                   .format(self.table_name, placeholders(len(chunk))), chunk)
+
+    def yield_keys(self, prefix: Optional[str] = None) -> Iterator[str]:
+        connection = self.get_connection()
+        if prefix:
+            # compared as a plain string, "%" and "_" in the prefix are not LIKE wildcards
+            cursor = connection.execute('SELECT id FROM "{}" WHERE substr(id, 1, ?) = ?'.format(self.table_name),
+                                        (len(prefix), prefix))
+        else:
+            cursor = connection.execute('SELECT id FROM "{}"'.format(self.table_name))
+        for row in cursor.fetchall():
+            yield row[0]
+
+
+def create_docstore(backend: str, store_path: str, db_path: str, user_id: str,
+                    import_legacy: bool = True) -> SQLiteDocstore:
+    store = SQLiteDocstore(get_docstore_file(backend, store_path, db_path, user_id), user_id, wal=backend != "chroma")
+    if import_legacy and backend != "chroma":
+        # the chroma vectors of documents uploaded before the docstore moved out point to the legacy table
+        store.import_legacy(get_docstore_file("chroma", store_path, db_path, user_id))
+    return store
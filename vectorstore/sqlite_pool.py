@@ -0,0 +1,37 @@
+import sqlite3
+import threading
+from typing import Dict, Iterator, List, Sequence, TypeVar
+
+T = TypeVar("T")
+
+# below the default SQLITE_MAX_VARIABLE_NUMBER (999) of older sqlite builds
+MAX_VARIABLES: int = 900
+_busy_timeout: int = 30  # seconds
+_local = threading.local()
+
+
+def get_connection(path: str, wal: bool = True) -> sqlite3.Connection:
+    """
+    persistent connection to the database file, one per thread: sqlite connections can't be shared.
+    wal=False leaves the journal mode of databases owned by someone else (e.g. chroma) as it is
+    """
+    connections: Dict[str, sqlite3.Connection] = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = dict()
+    if path not in connections:
+        connection = sqlite3.connect(path, timeout=_busy_timeout)
+        if wal:
+            # readers don't block the writer (and other processes) in WAL mode
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+        connections[path] = connection
+    return connections[path]
+
+
+def chunks(values: Sequence[T], size: int = MAX_VARIABLES) -> Iterator[List[T]]:
+    for i in range(0, len(values), size):
+        yield list(values[i:i + size])
+
+
+def placeholders(count: int) -> str:
+    return ", ".join("?" * count)